@@ -1,3 +1,100 @@
-from cassandra.cluster import Cluster
-cluster = Cluster(["127.0.0.1"])
-cassandra_session = cluster.connect("socialmedia")
\ No newline at end of file
+import asyncio
+import threading
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
+
+# Token-aware routing sends each bound prepared statement straight to a replica
+# owning the conversation's partition (the driver knows the key from the metadata)
+cluster = Cluster(
+    ["127.0.0.1"],
+    execution_profiles={
+        EXEC_PROFILE_DEFAULT: ExecutionProfile(
+            load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy()),
+        ),
+    },
+)
+cassandra_session = cluster.connect("socialmedia")
+
+# ---------- Prepared-statement registry ----------
+# Every CQL statement the chat app runs. Values are always bound, never formatted in.
+STATEMENTS = {
+    "insert_message": """
+        INSERT INTO messages (conversation_id, timestamp, message_id, author_id, author_username, content)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    # History pages: newest first unless paging forward from an `after` cursor
+    "history_latest": """
+        SELECT author_username, content, timestamp FROM messages
+        WHERE conversation_id = ?
+        ORDER BY timestamp DESC LIMIT ?
+    """,
+    "history_before": """
+        SELECT author_username, content, timestamp FROM messages
+        WHERE conversation_id = ? AND timestamp < ?
+        ORDER BY timestamp DESC LIMIT ?
+    """,
+    "history_after": """
+        SELECT author_username, content, timestamp FROM messages
+        WHERE conversation_id = ? AND timestamp > ?
+        ORDER BY timestamp ASC LIMIT ?
+    """,
+    "history_between": """
+        SELECT author_username, content, timestamp FROM messages
+        WHERE conversation_id = ? AND timestamp < ? AND timestamp > ?
+        ORDER BY timestamp DESC LIMIT ?
+    """,
+}
+
+
+class PreparedStatements:
+    """Prepares each registered statement once for the session and hands back the cached one."""
+
+    def __init__(self, session, statements: dict):
+        self._session = session
+        self._statements = statements
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str):
+        prepared = self._prepared.get(name)
+        if prepared is None:
+            with self._lock:
+                prepared = self._prepared.get(name)
+                if prepared is None:
+                    prepared = self._session.prepare(self._statements[name])
+                    self._prepared[name] = prepared
+        return prepared
+
+    def prepare_all(self) -> None:
+        for name in self._statements:
+            self[name]
+
+
+statements = PreparedStatements(cassandra_session, STATEMENTS)
+# Prepare up front so the async consumer never blocks on a first-use round trip
+statements.prepare_all()
+
+
+def execute_async(statement, params=None) -> asyncio.Future:
+    """
+    Runs a statement with the driver's execute_async and returns an asyncio
+    future for it, so consumers can await Cassandra without blocking the loop.
+    The driver resolves ResponseFutures on its own IO thread, hence call_soon_threadsafe.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def set_result(rows):
+        if not future.done():
+            future.set_result(rows)
+
+    def set_exception(exc):
+        if not future.done():
+            future.set_exception(exc)
+
+    response_future = cassandra_session.execute_async(statement, params)
+    response_future.add_callbacks(
+        lambda rows: loop.call_soon_threadsafe(set_result, rows),
+        lambda exc: loop.call_soon_threadsafe(set_exception, exc),
+    )
+    return future
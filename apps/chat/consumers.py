@@ -1,14 +1,23 @@
 # apps/chat/consumers.py
 import json
+import asyncio
+import logging
+import time
 import uuid
 import datetime
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from cassandra.util import uuid_from_time
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import Conversation, ConversationParticipant
-from apps.chat.cassandra import cassandra_session
+from apps.chat.cassandra import statements, execute_async
+from apps.chat.membership import is_participant
+from apps.chat.write_behind import last_message_buffer, read_receipt_buffer
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Typing indicators: at most one `typing` publish per interval per typer, and an
+# automatic `stopped` once no typing frame has arrived for the idle timeout
+TYPING_MIN_INTERVAL = 1.0  # seconds
+TYPING_IDLE_TIMEOUT = 3.0
 
 def timeuuid_to_datetime(timeuuid_obj: uuid.UUID) -> datetime.datetime:
     uuid_timestamp = timeuuid_obj.time
@@ -17,6 +26,10 @@ def timeuuid_to_datetime(timeuuid_obj: uuid.UUID) -> datetime.datetime:
 
 
 class ChatConsumer(AsyncJsonWebsocketConsumer):
+    typing_active = False
+    typing_published_at = 0.0
+    typing_idle_handle = None
+
     async def connect(self):
         self.user = self.scope.get("user")
         if not self.user or not self.user.is_authenticated:
@@ -26,12 +39,18 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
         self.room_group_name = f'chat_{self.conversation_id}'
 
-        # TODO: Check if user is a participant of this conversation in Postgres
-        
+        # One Redis round trip; Postgres is only hit when the set isn't cached yet
+        if not await is_participant(self.conversation_id, self.user.id):
+            await self.close()
+            return
+
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return  # rejected in connect(), never joined
+        await self.stop_typing()
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     # This is the main dispatcher for incoming WebSocket messages
@@ -48,29 +67,20 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     # --- Handlers for specific commands ---
 
     async def handle_new_message(self, message_content):
-        now = datetime.datetime.utcnow()
+        now = datetime.datetime.now(datetime.timezone.utc)
         time_uuid_for_db = uuid_from_time(now)
 
-        message_data = {
-            'conversation_id': uuid.UUID(self.conversation_id),
-            'timestamp': time_uuid_for_db,
-            'message_id': uuid.uuid4(),
-            'author_id': self.user.id,
-            'author_username': self.user.username,
-            'content': message_content,
-        }
-        
-        cassandra_session.execute(
-            """
-            INSERT INTO messages (conversation_id, timestamp, message_id, author_id, author_username, content)
-            VALUES (%(conversation_id)s, %(timestamp)s, %(message_id)s, %(author_id)s, %(author_username)s, %(content)s)
-            """,
-            message_data
-        )
-
-        # Update last_message_at in Postgres
-        await self.update_conversation_timestamp(now)
-
+        # Kick off the write without waiting for Cassandra's ack...
+        write = execute_async(statements["insert_message"], (
+            uuid.UUID(self.conversation_id),
+            time_uuid_for_db,
+            uuid.uuid4(),
+            self.user.id,
+            self.user.username,
+            message_content,
+        ))
+
+        # ...so the broadcast goes out while the write is in flight
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -84,8 +94,58 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 }
             }
         )
+
+        try:
+            await write
+        except Exception as exc:
+            logger.error("Failed to persist message in %s: %s", self.conversation_id, exc)
+            await self.send_json({
+                'type': 'error',
+                'conversation_id': self.conversation_id,
+                'error': 'Message could not be saved.',
+            })
+            return
+
+        # Only a stored message moves last_message_at, the inbox preview and unread
+        # counts; they are written behind, coalesced with the rest of this worker's traffic
+        last_message_buffer.record(
+            self.conversation_id,
+            timestamp=now,
+            author_id=self.user.id,
+            author_username=self.user.username,
+            content=message_content,
+        )
         
     async def handle_typing_indicator(self, status):
+        if status != 'typing':
+            await self.stop_typing()
+            return
+
+        self.reset_typing_idle_timer()
+        now = time.monotonic()
+        if self.typing_active and now - self.typing_published_at < TYPING_MIN_INTERVAL:
+            return  # Throttled: never reaches the channel layer
+        self.typing_active = True
+        self.typing_published_at = now
+        await self.publish_typing('typing')
+
+    async def stop_typing(self):
+        if self.typing_idle_handle:
+            self.typing_idle_handle.cancel()
+            self.typing_idle_handle = None
+        if not self.typing_active:
+            return
+        self.typing_active = False
+        await self.publish_typing('stopped')
+
+    def reset_typing_idle_timer(self):
+        if self.typing_idle_handle:
+            self.typing_idle_handle.cancel()
+        self.typing_idle_handle = asyncio.get_running_loop().call_later(
+            TYPING_IDLE_TIMEOUT, lambda: asyncio.ensure_future(self.stop_typing())
+        )
+
+    async def publish_typing(self, status):
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -96,16 +156,11 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         )
         
     async def handle_read_receipt(self):
-        now = datetime.datetime.utcnow()
-        await self.update_participant_read_timestamp(now)
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'read.receipt',
-                'username': self.user.username,
-                'timestamp': now.isoformat(),
-            }
+        # Debounced: persisted and fanned out (merged as `read.receipts`) by the buffer's next flush
+        now = datetime.datetime.now(datetime.timezone.utc)
+        read_receipt_buffer.touch(
+            (self.conversation_id, self.user.id),
+            (now, self.user.username),
         )
 
     # --- Methods to broadcast events back to the client ---
@@ -118,17 +173,5 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         if event['username'] != self.user.username:
             await self.send_json(event)
             
-    async def read_receipt(self, event):
-        await self.send_json(event)
-
-    # --- Database helpers ---
-    @database_sync_to_async
-    def update_conversation_timestamp(self, timestamp):
-        Conversation.objects.filter(id=self.conversation_id).update(last_message_at=timestamp)
-
-    @database_sync_to_async
-    def update_participant_read_timestamp(self, timestamp):
-        ConversationParticipant.objects.filter(
-            conversation_id=self.conversation_id,
-            user=self.user
-        ).update(last_read_timestamp=timestamp)
\ No newline at end of file
+    async def read_receipts(self, event):
+        await self.send_json(event)
\ No newline at end of file
@@ -0,0 +1,80 @@
+# apps/chat/membership.py
+"""
+Conversation membership checks backed by a Redis set of participant ids.
+
+ChatConsumer.connect runs on every connect and reconnect, so the check has to
+be cheap under reconnect storms: one pipelined SISMEMBER + EXISTS round trip.
+A miss loads the participants from Postgres once and caches the whole set.
+A sentinel member marks the set as loaded, so an empty or unknown conversation
+is cached as "nobody" instead of missing every time.
+"""
+import logging
+import uuid
+from typing import Iterable, Set
+import redis
+from channels.db import database_sync_to_async
+from socialmedia.redis_helpers import RedisConnection
+from .models import ConversationParticipant
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_TTL = 60 * 60  # seconds
+_LOADED = "*"
+
+get_redis = RedisConnection("CHAT_REDIS_URL")
+get_async_redis = RedisConnection("CHAT_REDIS_URL", asyncio=True)
+
+
+def membership_key(conversation_id) -> str:
+    return f"chat:participants:{conversation_id}"
+
+
+def _load_participants(conversation_id) -> Set[str]:
+    return {
+        str(user_id) for user_id in
+        ConversationParticipant.objects.filter(conversation_id=conversation_id)
+        .values_list("user_id", flat=True)
+    }
+
+
+def cache_participants(conversation_id, user_ids: Iterable[int]) -> None:
+    """Stores the complete participant set, e.g. right after a conversation is created."""
+    key = membership_key(conversation_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(key)
+        pipe.sadd(key, _LOADED, *[str(user_id) for user_id in user_ids])
+        pipe.expire(key, MEMBERSHIP_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        # The next check misses and reloads from Postgres
+        logger.exception("Could not cache participants for %s", conversation_id)
+
+
+async def is_participant(conversation_id: str, user_id: int) -> bool:
+    try:
+        uuid.UUID(conversation_id)
+    except ValueError:
+        return False
+
+    key = membership_key(conversation_id)
+    try:
+        async with get_async_redis().pipeline(transaction=False) as pipe:
+            pipe.sismember(key, str(user_id))
+            pipe.exists(key)
+            is_member, loaded = await pipe.execute()
+        if loaded:
+            return bool(is_member)
+    except redis.RedisError:
+        logger.exception("Membership cache unavailable; checking Postgres")
+        return str(user_id) in await database_sync_to_async(_load_participants)(conversation_id)
+
+    participants = await database_sync_to_async(_load_participants)(conversation_id)
+    try:
+        async with get_async_redis().pipeline(transaction=True) as pipe:
+            pipe.sadd(key, _LOADED, *participants)
+            pipe.expire(key, MEMBERSHIP_TTL)
+            await pipe.execute()
+    except redis.RedisError:
+        logger.exception("Could not cache participants for %s", conversation_id)
+    return str(user_id) in participants
@@ -4,19 +4,11 @@ from urllib.parse import parse_qs
 
 @database_sync_to_async
 def get_user_from_token(token_key):
-    # IMPORT them here, inside the function
-    from django.contrib.auth import get_user_model
-    from graphql_jwt.utils import jwt_decode
+    # IMPORT it here, inside the function
+    from apps.users.auth import get_user_from_token as resolve_token_user
 
-    User = get_user_model()
-    try:
-        payload = jwt_decode(token_key)
-        username = payload.get('username')
-        user = User.objects.get(username=username)
-        return user
-    except (User.DoesNotExist, Exception):
-        # It's better to explicitly return None on any failure
-        return None
+    # Shared with the HTTP entry points: Redis-cached by user id, None on any failure
+    return resolve_token_user(token_key)
 
 class JwtAuthMiddleware:
     def __init__(self, app):
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_direct_keys(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationParticipant = apps.get_model('chat', 'ConversationParticipant')
+
+    two_person = (
+        Conversation.objects.annotate(p_count=Count('participants'))
+        .filter(p_count=2)
+        .order_by('created_at')
+        .values_list('id', flat=True)
+    )
+    seen = set()
+    batch = []
+    for conversation_id in two_person.iterator(chunk_size=2000):
+        user_ids = sorted(
+            ConversationParticipant.objects.filter(conversation_id=conversation_id)
+            .values_list('user_id', flat=True)
+        )
+        key = f"{user_ids[0]}:{user_ids[1]}"
+        # Duplicate DMs created before the unique index: the oldest keeps the key
+        if key in seen:
+            continue
+        seen.add(key)
+        batch.append(Conversation(id=conversation_id, direct_key=key))
+        if len(batch) >= 2000:
+            Conversation.objects.bulk_update(batch, ['direct_key'])
+            batch = []
+    if batch:
+        Conversation.objects.bulk_update(batch, ['direct_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_conversation_last_message_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='direct_key',
+            field=models.CharField(blank=True, editable=False, max_length=41, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_direct_keys, migrations.RunPython.noop),
+    ]
@@ -8,7 +8,13 @@ User = get_user_model()
 class Conversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Snapshot of the newest message for inbox previews (kept by apps.chat.write_behind)
+    last_message_author = models.CharField(max_length=150, blank=True)
+    last_message_preview = models.CharField(max_length=200, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # "<lower user id>:<higher user id>" for two-person conversations; the unique
+    # index makes the DM lookup a single probe and stops duplicate DMs under races
+    direct_key = models.CharField(max_length=41, unique=True, null=True, blank=True, editable=False)
 
     participants = models.ManyToManyField(
         User,
@@ -16,6 +22,11 @@ class Conversation(models.Model):
         related_name='conversations'
     )
     
+    @staticmethod
+    def direct_key_for(user_id, other_user_id) -> str:
+        low, high = sorted((int(user_id), int(other_user_id)))
+        return f"{low}:{high}"
+
     def __str__(self):
         return f"Conversation {self.id}"
 
@@ -30,6 +41,8 @@ class ConversationParticipant(models.Model):
         on_delete=models.CASCADE,
     )
     last_read_timestamp = models.DateTimeField(null=True, blank=True)
+    # Messages from others since this participant last read; reset by read receipts
+    unread_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('user', 'conversation')
@@ -1,14 +1,16 @@
 import uuid
-from typing import List
-from django.db.models import Count
+from typing import List, Optional
+from django.db import transaction
+from django.db.models import Prefetch
 from django.contrib.auth import get_user_model
 from strawberry.types import Info
 from graphql_jwt.exceptions import PermissionDenied
 from graphql import GraphQLError
 
 from apps.chat.models import Conversation, ConversationParticipant
-from apps.chat.cassandra import cassandra_session  # see note below
-from apps.chat.utils import timeuuid_to_datetime  # see note below
+from apps.chat.cassandra import cassandra_session, statements  # see note below
+from apps.chat.membership import cache_participants
+from apps.chat.utils import timeuuid_to_datetime, encode_cursor, decode_cursor  # see note below
 from apps.graphql_api.utils import get_user
 User = get_user_model()
 
@@ -31,61 +33,98 @@ def start_conversation(info: Info, participant_username: str) -> Conversation:
     if user.id == other.id:
         raise GraphQLError("You cannot start a conversation with yourself.")
 
-    # 3. Idempotency: conversation with exactly these two users
-    existing = (
-        Conversation.objects
-        .annotate(p_count=Count("participants"))
-        .filter(p_count=2)
-        .filter(participants=user)
-        .filter(participants=other)
-        .distinct()
-        .first()
-    )
-    print(f"[start_conversation] existing conversation = {existing}")
-    if existing:
-        return existing
-    
-    # 4. Create new conversation
-    conv = Conversation.objects.create()
-    ConversationParticipant.objects.bulk_create(
-        [
-            ConversationParticipant(user=user, conversation=conv),
-            ConversationParticipant(user=other, conversation=conv),
-        ]
-    )
+    # 3. Idempotency: one indexed probe on the canonical pair key. If two requests
+    #    race, the unique index lets exactly one insert win and get_or_create hands
+    #    the loser the winner's row.
+    with transaction.atomic():
+        conv, created = Conversation.objects.get_or_create(
+            direct_key=Conversation.direct_key_for(user.id, other.id)
+        )
+        if not created:
+            return conv
+
+        # 4. New conversation: participants commit together with the row
+        ConversationParticipant.objects.bulk_create(
+            [
+                ConversationParticipant(user=user, conversation=conv),
+                ConversationParticipant(user=other, conversation=conv),
+            ]
+        )
+    # Seed the membership cache so the first websocket connect doesn't miss
+    transaction.on_commit(lambda: cache_participants(conv.id, [user.id, other.id]))
     return conv
 
 
 def list_conversations(info: Info) -> List[Conversation]:
     user = get_user(info)
-    return list(user.conversations.all().order_by("-last_message_at"))
+    # One extra query loads every participant (with user and profile) for the whole inbox;
+    # ConversationType's participants / unreadCount resolvers read from this cache
+    participants = ConversationParticipant.objects.select_related("user", "user__profile")
+    return list(
+        user.conversations.all()
+        .prefetch_related(Prefetch("conversationparticipant_set", queryset=participants))
+        .order_by("-last_message_at")
+    )
+
 
+MAX_PAGE_SIZE = 100
 
-def list_messages(info: Info, conversation_id: str, limit: int = 50) -> List["MessageType"]:  #type: ignore
+def list_messages(
+    info: Info,
+    conversation_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
+) -> "MessagePage":  #type: ignore
     """
-    Returns a list of MessageType *dataclass* instances (not ORM models).
-    MessageType is assumed to be defined in schema.py
+    One page of a conversation's history, newest first.
+
+    `before` / `after` are opaque cursors from a previous PageInfo. Each page is
+    a single clustering-key range slice on the conversation's partition, so
+    scrolling deep into history costs the same per page as the first one.
     """
-    from apps.graphql_api.types import MessageType  # avoid circular import
+    from apps.graphql_api.types import MessageType, MessagePage, PageInfo  # avoid circular import
 
     user = get_user(info)
     conv_uuid = uuid.UUID(conversation_id)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        before_uuid = decode_cursor(before) if before else None
+        after_uuid = decode_cursor(after) if after else None
+    except ValueError:
+        raise GraphQLError("Invalid cursor.")
 
-    rows = cassandra_session.execute(
-        """
-        SELECT author_username, content, timestamp
-        FROM   messages
-        WHERE  conversation_id = %s
-        LIMIT  %s
-        """,
-        (conv_uuid, limit),
-    )
+    # Paging forward from `after` alone reads oldest-first, so the page starts right at the cursor
+    forward = after_uuid is not None and before_uuid is None
 
-    return [
-        MessageType(
-            author_username=row.author_username,
-            content=row.content,
-            timestamp=timeuuid_to_datetime(row.timestamp).isoformat(),
-        )
-        for row in rows
-    ]
\ No newline at end of file
+    # Fetch one extra row to learn whether another page exists
+    if before_uuid and after_uuid:
+        statement, params = statements["history_between"], (conv_uuid, before_uuid, after_uuid, limit + 1)
+    elif before_uuid:
+        statement, params = statements["history_before"], (conv_uuid, before_uuid, limit + 1)
+    elif after_uuid:
+        statement, params = statements["history_after"], (conv_uuid, after_uuid, limit + 1)
+    else:
+        statement, params = statements["history_latest"], (conv_uuid, limit + 1)
+    rows = list(cassandra_session.execute(statement, params))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if forward:
+        rows.reverse()
+
+    return MessagePage(
+        messages=[
+            MessageType(
+                author_username=row.author_username,
+                content=row.content,
+                timestamp=timeuuid_to_datetime(row.timestamp).isoformat(),
+            )
+            for row in rows
+        ],
+        page_info=PageInfo(
+            has_older=True if forward else (has_more or after_uuid is not None),
+            has_newer=has_more if forward else before_uuid is not None,
+            start_cursor=encode_cursor(rows[0].timestamp) if rows else None,
+            end_cursor=encode_cursor(rows[-1].timestamp) if rows else None,
+        ),
+    )
@@ -1,3 +1,213 @@
-from django.test import TestCase
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from cassandra.util import uuid_from_time
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from graphql import GraphQLError
+
+from apps.chat import services
+from apps.chat.cassandra import STATEMENTS, PreparedStatements, cluster
+from apps.chat.models import Conversation, ConversationParticipant
+from apps.chat.utils import decode_cursor, encode_cursor
+from apps.chat.write_behind import LastMessageBuffer, ReadReceiptBuffer
+
+User = get_user_model()
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        tuid = uuid_from_time(time.time())
+        self.assertEqual(decode_cursor(encode_cursor(tuid)), tuid)
+
+    def test_rejects_non_timeuuid(self):
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor(uuid.uuid4()))
+
+
+TEST_KEYSPACE = settings.CASSANDRA_DATABASES["cassandra"]["TEST_NAME"]
+TEST_STATEMENTS = {
+    **STATEMENTS,
+    "delete_conversation": "DELETE FROM messages WHERE conversation_id = ?",
+}
+
+
+class ListMessagesPagingTests(SimpleTestCase):
+    """
+    Pages through five messages, m1 (oldest) .. m5 (newest), two at a time.
+    Runs against the test keyspace, never the app's own.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Identifiers can't be bound, so the DDL is formatted from settings
+        session = cluster.connect()
+        session.execute(
+            f"CREATE KEYSPACE IF NOT EXISTS {TEST_KEYSPACE} "
+            "WITH replication = {'class': 'SimpleStrategy', 'replication_factor': 1}"
+        )
+        session.set_keyspace(TEST_KEYSPACE)
+        session.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id uuid, timestamp timeuuid, message_id uuid,
+                author_id bigint, author_username text, content text,
+                PRIMARY KEY (conversation_id, timestamp)
+            ) WITH CLUSTERING ORDER BY (timestamp DESC)
+        """)
+        cls.session = session
+        cls.statements = PreparedStatements(session, TEST_STATEMENTS)
+        for name, value in (("cassandra_session", session), ("statements", cls.statements)):
+            patcher = mock.patch.object(services, name, value)
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        cls.addClassCleanup(session.shutdown)
+
+    def setUp(self):
+        self.conversation_id = uuid.uuid4()
+        base = time.time() - 60
+        self.timestamps = [uuid_from_time(base + i) for i in range(5)]
+        for i, timestamp in enumerate(self.timestamps, start=1):
+            self.session.execute(self.statements["insert_message"], (
+                self.conversation_id, timestamp, uuid.uuid4(), 1, "alice", f"m{i}",
+            ))
+        self.info = SimpleNamespace(context=SimpleNamespace(request=RequestFactory().get("/graphql/")))
+
+    def tearDown(self):
+        self.session.execute(self.statements["delete_conversation"], (self.conversation_id,))
+
+    def page(self, **kwargs):
+        return services.list_messages(self.info, str(self.conversation_id), limit=2, **kwargs)
+
+    def contents(self, page):
+        return [message.content for message in page.messages]
+
+    def cursor(self, n):
+        return encode_cursor(self.timestamps[n - 1])
+
+    def test_first_page_is_newest(self):
+        page = self.page()
+        self.assertEqual(self.contents(page), ["m5", "m4"])
+        self.assertTrue(page.page_info.has_older)
+        self.assertFalse(page.page_info.has_newer)
+        self.assertEqual(page.page_info.start_cursor, self.cursor(5))
+        self.assertEqual(page.page_info.end_cursor, self.cursor(4))
+
+    def test_paging_older(self):
+        page = self.page(before=self.page().page_info.end_cursor)
+        self.assertEqual(self.contents(page), ["m3", "m2"])
+        self.assertTrue(page.page_info.has_older)
+        self.assertTrue(page.page_info.has_newer)
+
+        last = self.page(before=page.page_info.end_cursor)
+        self.assertEqual(self.contents(last), ["m1"])
+        self.assertFalse(last.page_info.has_older)
+        self.assertTrue(last.page_info.has_newer)
+
+    def test_paging_newer(self):
+        # Forward pages start right after the cursor and are still returned newest first
+        page = self.page(after=self.cursor(2))
+        self.assertEqual(self.contents(page), ["m4", "m3"])
+        self.assertTrue(page.page_info.has_older)
+        self.assertTrue(page.page_info.has_newer)
+
+        last = self.page(after=page.page_info.start_cursor)
+        self.assertEqual(self.contents(last), ["m5"])
+        self.assertTrue(last.page_info.has_older)
+        self.assertFalse(last.page_info.has_newer)
+
+    def test_between_cursors(self):
+        page = services.list_messages(
+            self.info, str(self.conversation_id), before=self.cursor(5), after=self.cursor(1), limit=2,
+        )
+        self.assertEqual(self.contents(page), ["m4", "m3"])
+        self.assertTrue(page.page_info.has_older)
+        self.assertTrue(page.page_info.has_newer)
+
+    def test_empty_page(self):
+        page = self.page(after=self.cursor(5))
+        self.assertEqual(page.messages, [])
+        self.assertFalse(page.page_info.has_newer)
+        self.assertIsNone(page.page_info.start_cursor)
+        self.assertIsNone(page.page_info.end_cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(GraphQLError):
+            self.page(before="not-a-cursor")
+
+
+# The receipt flush runs through database_sync_to_async, which needs real commits
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class UnreadCountTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        self.conversation = Conversation.objects.create()
+        for user in (self.alice, self.bob):
+            ConversationParticipant.objects.create(user=user, conversation=self.conversation)
+        self.now = timezone.now()
+
+    def flush_messages(self, author, timestamp, count=1):
+        async_to_sync(LastMessageBuffer().write)({
+            self.conversation.id: (timestamp, author.username, "hi", Counter({author.id: count})),
+        })
+
+    def flush_receipt(self, user, timestamp):
+        async_to_sync(ReadReceiptBuffer().write)({
+            (self.conversation.id, user.id): (timestamp, user.username),
+        })
+
+    def participant(self, user):
+        return ConversationParticipant.objects.get(user=user, conversation=self.conversation)
+
+    def test_messages_count_for_everyone_but_the_author(self):
+        self.flush_messages(self.alice, self.now, count=3)
+        self.assertEqual(self.participant(self.bob).unread_count, 3)
+        self.assertEqual(self.participant(self.alice).unread_count, 0)
+
+    def test_one_flush_counts_each_senders_messages_for_the_others(self):
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="pw")
+        ConversationParticipant.objects.create(user=carol, conversation=self.conversation)
+        async_to_sync(LastMessageBuffer().write)({
+            self.conversation.id: (self.now, "bob", "hi", Counter({self.alice.id: 2, self.bob.id: 3})),
+        })
+        self.assertEqual(self.participant(self.alice).unread_count, 3)
+        self.assertEqual(self.participant(self.bob).unread_count, 2)
+        self.assertEqual(self.participant(carol).unread_count, 5)
+
+    def test_receipt_covering_newest_message_clears_count(self):
+        self.flush_messages(self.alice, self.now, count=2)
+        self.flush_receipt(self.bob, self.now)
+        participant = self.participant(self.bob)
+        self.assertEqual(participant.unread_count, 0)
+        self.assertEqual(participant.last_read_timestamp, self.now)
+
+    def test_receipt_older_than_newest_message_keeps_count(self):
+        # Bob read up to the first message; the second was flushed before his receipt was
+        self.flush_messages(self.alice, self.now)
+        self.flush_messages(self.alice, self.now + timedelta(seconds=1))
+        self.flush_receipt(self.bob, self.now)
+        participant = self.participant(self.bob)
+        self.assertEqual(participant.unread_count, 2)
+        self.assertEqual(participant.last_read_timestamp, self.now)
+
+    def test_messages_after_a_receipt_count_again(self):
+        self.flush_messages(self.alice, self.now)
+        self.flush_receipt(self.bob, self.now)
+        self.flush_messages(self.alice, self.now + timedelta(seconds=1))
+        self.assertEqual(self.participant(self.bob).unread_count, 1)
+
+    def test_stale_receipt_never_moves_read_timestamp_back(self):
+        self.flush_messages(self.alice, self.now)
+        self.flush_receipt(self.bob, self.now)
+        self.flush_receipt(self.bob, self.now - timedelta(minutes=5))
+        participant = self.participant(self.bob)
+        self.assertEqual(participant.last_read_timestamp, self.now)
+        self.assertEqual(participant.unread_count, 0)
@@ -1,6 +1,21 @@
+import base64
 import uuid
 import datetime
 
 def timeuuid_to_datetime(tuid: uuid.UUID) -> datetime.datetime:
     unix = (tuid.time / 1e7) - 12219292800
-    return datetime.datetime.fromtimestamp(unix, tz=datetime.timezone.utc)
\ No newline at end of file
+    return datetime.datetime.fromtimestamp(unix, tz=datetime.timezone.utc)
+
+
+def encode_cursor(tuid: uuid.UUID) -> str:
+    """Opaque page cursor for a message's clustering timeuuid."""
+    return base64.urlsafe_b64encode(tuid.bytes).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    tuid = uuid.UUID(bytes=base64.urlsafe_b64decode(padded.encode("ascii")))
+    if tuid.version != 1:
+        raise ValueError("not a timeuuid cursor")
+    return tuid
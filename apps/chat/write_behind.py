@@ -0,0 +1,193 @@
+# apps/chat/write_behind.py
+"""
+Per-worker write-behind buffers for hot chat rows.
+
+Consumers record the newest value per key here instead of writing to
+Postgres on every websocket frame; a loop task flushes each buffer as a
+single bulk UPDATE every few hundred milliseconds. Updates go through
+GREATEST() so flushes from different workers (or a retried, older batch)
+can never move a timestamp backwards. Readers lag by at most one interval.
+"""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import LessThanOrEqual
+from .models import Conversation, ConversationParticipant
+
+logger = logging.getLogger(__name__)
+
+LAST_MESSAGE_FLUSH_INTERVAL = 0.3  # seconds
+READ_RECEIPT_FLUSH_INTERVAL = 1.0
+PREVIEW_LENGTH = 200  # Conversation.last_message_preview max_length
+
+
+class CoalescingBuffer:
+    """Folds values per key with combine() (default: keep the largest) and hands batches to write() on an interval."""
+    flush_interval: float = 0.3
+
+    def __init__(self):
+        self._pending = {}
+        self._task = None
+
+    def touch(self, key, value) -> None:
+        self._merge({key: value})
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def combine(self, current, value):
+        return max(current, value)
+
+    def _merge(self, batch: dict) -> None:
+        for key, value in batch.items():
+            current = self._pending.get(key)
+            self._pending[key] = value if current is None else self.combine(current, value)
+
+    async def _run(self) -> None:
+        # Runs while there is work and exits when idle; the next touch() restarts it
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            await self.write(batch)
+        except Exception:
+            logger.exception("%s failed to flush %s entries", type(self).__name__, len(batch))
+            self._merge(batch)  # retry on the next tick without losing newer values
+
+    async def write(self, batch: dict) -> None:
+        raise NotImplementedError
+
+
+# ---------- Conversation.last_message_* snapshot and unread counts ----------
+@database_sync_to_async
+def _bulk_update_last_messages(batch: dict) -> None:
+    # Every SET below reads the row as it was before this UPDATE, so the snapshot
+    # only moves when this batch's message is at least as new as the stored one
+    newer = {
+        conversation_id: Q(id=conversation_id) & (Q(last_message_at__isnull=True) | Q(last_message_at__lte=timestamp))
+        for conversation_id, (timestamp, _, _, _) in batch.items()
+    }
+    with transaction.atomic():
+        Conversation.objects.filter(id__in=batch.keys()).update(
+            last_message_at=Case(
+                # Postgres GREATEST skips NULLs, so a first message still lands
+                *[When(id=conversation_id, then=Greatest(F("last_message_at"), Value(timestamp)))
+                  for conversation_id, (timestamp, _, _, _) in batch.items()],
+                default=F("last_message_at"),
+            ),
+            last_message_author=Case(
+                *[When(newer[conversation_id], then=Value(author))
+                  for conversation_id, (_, author, _, _) in batch.items()],
+                default=F("last_message_author"),
+            ),
+            last_message_preview=Case(
+                *[When(newer[conversation_id], then=Value(preview))
+                  for conversation_id, (_, _, preview, _) in batch.items()],
+                default=F("last_message_preview"),
+            ),
+        )
+        # Everyone gets the conversation's total minus what they sent themselves; the
+        # per-author Whens come first so they shadow the conversation-wide one
+        totals = {conversation_id: sum(counts.values()) for conversation_id, (_, _, _, counts) in batch.items()}
+        ConversationParticipant.objects.filter(conversation_id__in=batch.keys()).update(
+            unread_count=F("unread_count") + Case(
+                *[When(conversation_id=conversation_id, user_id=author_id, then=Value(totals[conversation_id] - sent))
+                  for conversation_id, (_, _, _, counts) in batch.items()
+                  for author_id, sent in counts.items()],
+                *[When(conversation_id=conversation_id, then=Value(total))
+                  for conversation_id, total in totals.items()],
+                default=Value(0),
+            ),
+        )
+
+
+class LastMessageBuffer(CoalescingBuffer):
+    """
+    conversation_id -> (newest timestamp, its author, its preview, Counter of messages per author_id).
+    The snapshot follows the newest message; the counts add up for unread badges.
+    """
+    flush_interval = LAST_MESSAGE_FLUSH_INTERVAL
+
+    def record(self, conversation_id, *, timestamp, author_id, author_username, content) -> None:
+        self.touch(conversation_id, (
+            timestamp, author_username, content[:PREVIEW_LENGTH], Counter({author_id: 1}),
+        ))
+
+    def combine(self, current, value):
+        newest = value if value[0] >= current[0] else current
+        return (*newest[:3], current[3] + value[3])
+
+    async def write(self, batch: dict) -> None:
+        await _bulk_update_last_messages(batch)
+
+
+# ---------- ConversationParticipant.last_read_timestamp ----------
+@database_sync_to_async
+def _bulk_update_read_timestamps(batch: dict) -> None:
+    matches = [Q(conversation_id=conversation_id, user_id=user_id) for conversation_id, user_id in batch]
+    last_message_at = Subquery(
+        Conversation.objects.filter(id=OuterRef("conversation_id")).values("last_message_at")[:1]
+    )
+    ConversationParticipant.objects.filter(reduce(or_, matches)).update(
+        last_read_timestamp=Case(
+            *[When(match, then=Greatest(F("last_read_timestamp"), Value(timestamp)))
+              for match, (timestamp, _) in zip(matches, batch.values())],
+            default=F("last_read_timestamp"),
+        ),
+        # Only a receipt that covers the newest stored message clears the badge; one
+        # older than a message flushed since it was sent must keep that message counted
+        unread_count=Case(
+            *[When(match, then=Case(
+                When(LessThanOrEqual(last_message_at, Value(timestamp)), then=Value(0)),
+                default=F("unread_count"),
+            )) for match, (timestamp, _) in zip(matches, batch.values())],
+            default=F("unread_count"),
+        ),
+    )
+
+
+class ReadReceiptBuffer(CoalescingBuffer):
+    """
+    (conversation_id, user_id) -> (newest read timestamp, username).
+
+    Clients send a receipt on every scroll/focus; only the newest per user and
+    conversation survives a window. Each flush is one UPDATE plus one merged
+    `read.receipts` event per conversation.
+    """
+    flush_interval = READ_RECEIPT_FLUSH_INTERVAL
+
+    async def write(self, batch: dict) -> None:
+        await _bulk_update_read_timestamps(batch)
+
+        by_conversation = defaultdict(list)
+        for (conversation_id, _), (timestamp, username) in batch.items():
+            by_conversation[conversation_id].append({
+                'username': username,
+                'timestamp': timestamp.isoformat(),
+            })
+        channel_layer = get_channel_layer()
+        for conversation_id, receipts in by_conversation.items():
+            try:
+                await channel_layer.group_send(f'chat_{conversation_id}', {
+                    'type': 'read.receipts',
+                    'conversation_id': conversation_id,
+                    'receipts': receipts,
+                })
+            except Exception:
+                # Already persisted; a lost fan-out only delays other clients' read marks
+                logger.exception("Failed to broadcast read receipts for %s", conversation_id)
+
+
+last_message_buffer = LastMessageBuffer()
+read_receipt_buffer = ReadReceiptBuffer()
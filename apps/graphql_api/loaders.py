@@ -0,0 +1,73 @@
+from typing import Dict, Iterable, List, Optional
+from strawberry.types import Info
+from apps.users.models import Profile
+
+# Through table behind Profile.following: from_profile follows to_profile
+Follow = Profile.following.through
+
+
+class BatchLoader:
+    """
+    Request-scoped, synchronous take on strawberry's DataLoader.
+
+    The GraphQL view is sync, so strawberry.dataloader.DataLoader (which needs
+    a running event loop) can't be used here. Subclasses implement
+    batch_load(keys) -> {key: value} and are called once per batch of misses.
+    """
+    default = None
+
+    def __init__(self):
+        self._cache: Dict = {}
+
+    def batch_load(self, keys: List) -> Dict:
+        raise NotImplementedError
+
+    def load_many(self, keys: Iterable) -> List:
+        keys = list(keys)
+        missing = [k for k in dict.fromkeys(keys) if k not in self._cache]
+        if missing:
+            found = self.batch_load(missing)
+            for key in missing:
+                self._cache[key] = found.get(key, self.default)
+        return [self._cache[k] for k in keys]
+
+    def load(self, key):
+        return self.load_many([key])[0]
+
+
+class IsFollowingLoader(BatchLoader):
+    default = False
+
+    def __init__(self, viewer_profile_id: Optional[int]):
+        super().__init__()
+        self.viewer_profile_id = viewer_profile_id
+
+    def batch_load(self, keys):
+        if self.viewer_profile_id is None:
+            return {}
+        followed = Follow.objects.filter(
+            from_profile_id=self.viewer_profile_id, to_profile_id__in=keys
+        ).values_list("to_profile_id", flat=True)
+        return {profile_id: True for profile_id in followed}
+
+
+class ProfileLoaders:
+    def __init__(self, current_user=None):
+        viewer_profile_id = current_user.profile.id if current_user else None
+        self.is_following = IsFollowingLoader(viewer_profile_id)
+
+    def prime(self, profiles: Iterable[Profile]) -> None:
+        """Resolve every loader for a whole list of profiles up front (one query each)."""
+        # followers_count / following_count are denormalized columns on Profile
+        ids = [p.id for p in profiles]
+        self.is_following.load_many(ids)
+
+
+def get_loaders(info: Info, current_user=None) -> ProfileLoaders:
+    """Returns the ProfileLoaders bound to this request, creating them on first use."""
+    request = info.context.request
+    loaders = getattr(request, "_profile_loaders", None)
+    if loaders is None:
+        loaders = ProfileLoaders(current_user=current_user)
+        request._profile_loaders = loaders
+    return loaders
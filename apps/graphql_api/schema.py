@@ -1,5 +1,4 @@
 from __future__ import annotations
-import requests
 import strawberry
 from strawberry.types import Info
 from strawberry.exceptions import GraphQLError
@@ -9,7 +8,9 @@ from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from graphql_jwt.shortcuts import get_token
 from apps.chat.models import Conversation, ConversationParticipant
 from apps.graphql_api.utils import get_user, timeuuid_to_datetime
+from apps.graphql_api.loaders import get_loaders
 from apps.users.models import Profile
+from apps.users.search import search_profile_ids
 from apps.users.services import (
     ensure_email_verified, user_create, user_resend_verification_email, user_reset_password_confirm, user_reset_password_request,
     user_set_password, user_verify_email, profile_update, profile_follow,
@@ -17,16 +18,14 @@ from apps.users.services import (
     build_user_data, build_profile_data
 )
 from apps.chat import services  
-from graphql_jwt.utils import jwt_decode
 from django.contrib.auth import get_user_model
-from graphql_jwt.refresh_token.models import RefreshToken
+from apps.users.refresh_tokens import issue_refresh_token, rotate_refresh_token, InvalidRefreshToken
 from graphql_jwt.exceptions import PermissionDenied
 from typing import Optional
 from datetime import date
 from typing import List
-from requests.auth import HTTPBasicAuth
-from apps.users.utils import verify_turnstile_token # 👈 Import the function
-from .types import ConversationType, MessageType, UserType, ProfileType, AuthPayload, AuthSuccess, AuthRequiresVerification, RefreshPayload, VerifyEmailPayload
+from apps.users.utils import verify_turnstile_token, release_turnstile_token
+from .types import ConversationType, MessagePage, UserType, ProfileType, AuthPayload, AuthSuccess, AuthRequiresVerification, RefreshPayload, VerifyEmailPayload
 import uuid
 from django.db.models import Count
 
@@ -96,9 +95,11 @@ class TargetUserInput:
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    def register(self, data: RegisterInput) -> UserType:
+    def register(self, info: Info, data: RegisterInput) -> UserType:
         
-        is_captcha_valid = verify_turnstile_token(data.captcha_token)
+        # A valid token is claimed here, so one solved CAPTCHA registers one account
+        remote_ip = info.context.request.META.get('REMOTE_ADDR')
+        is_captcha_valid = verify_turnstile_token(data.captcha_token, remote_ip)
         if not is_captcha_valid:
             raise GraphQLError("Invalid CAPTCHA. Please try again.")
         
@@ -108,11 +109,13 @@ class Mutation:
                 email=data.email,
                 password=data.password,
             )
-            # Build user data with no current user (since just registered)
-            user_data = build_user_data(user=user, current_user=None)
-            return user_data
         except ValidationError as e:
+            # No account was created; let the client retry with the same token
+            release_turnstile_token(data.captcha_token)
             raise GraphQLError(str(e))
+        # Build user data with no current user (since just registered)
+        user_data = build_user_data(user=user, current_user=None)
+        return user_data
 
     @strawberry.mutation
     def token_auth(self, info: Info, data: TokenInput) -> AuthPayload:   #type: ignore
@@ -124,44 +127,33 @@ class Mutation:
             return AuthRequiresVerification(email=user.email)
 
         access = get_token(user)
-        refresh_obj = RefreshToken.objects.create(user=user)
+        refresh = issue_refresh_token(user)
         return AuthSuccess(
             access=access,
-            refresh=refresh_obj.token,
+            refresh=refresh,
             user=build_user_data(user=user, current_user=user),
         )
         
     @strawberry.mutation
     def refresh_token(self, info: Info, data: RefreshInput) -> RefreshPayload:
         try:
-            # Get refresh token from DB
-            refresh_token = RefreshToken.objects.select_related('user').get(
-                token=data.refresh
-            )
-            
-            if refresh_token.is_expired():
-                raise GraphQLError("Refresh token expired")
-            
-            user = refresh_token.user
-            
-            # Revoke old token
-            refresh_token.revoke()
+            # Check, revoke and replace the old token in one Redis round trip (+ user load and INSERT)
+            user, new_refresh = rotate_refresh_token(data.refresh)
             
             # Create new tokens
             access = get_token(user)
-            new_refresh_token = RefreshToken.objects.create(user=user)
             
             # Build user data
             user_data = build_user_data(user=user, current_user=user)
             
             return RefreshPayload(
                 access=access,
-                refresh=new_refresh_token.token,
+                refresh=new_refresh,
                 user=user_data
             )
             
-        except ObjectDoesNotExist:
-            raise GraphQLError("Invalid refresh token")
+        except InvalidRefreshToken as e:
+            raise GraphQLError(str(e))
         except Exception as e:
             raise GraphQLError(f"Refresh failed: {str(e)}")
 
@@ -174,8 +166,7 @@ class Mutation:
             # If user_verify_email returns a user, it means success.
             # Now, we generate tokens for them, just like in token_auth.
             access = get_token(user)
-            refresh_obj = RefreshToken.objects.create(user=user)
-            refresh = refresh_obj.token
+            refresh = issue_refresh_token(user)
             
             # Build and return the full payload
             user_data = build_user_data(user=user, current_user=user)
@@ -332,20 +323,11 @@ class Mutation:
 class Query:
     @strawberry.field
     def me(self, info: Info) -> Optional[UserType]:
-        request = info.context.request
-        auth = request.headers.get("authorization", "")
-        if not auth.startswith("JWT "):
-            raise PermissionDenied("UNAUTHENTICATED")
-        token = auth[4:]
-        try:
-            payload = jwt_decode(token)
-            user = User.objects.select_related('profile').get(
-                **{User.USERNAME_FIELD: payload["username"]}
-            )
-            user_data =  build_user_data(user=user, current_user=user, request=info.context.request)
-            return user_data
-        except Exception:
+        user = get_user(info)
+        if user is None:
             raise PermissionDenied("UNAUTHENTICATED")
+        user_data =  build_user_data(user=user, current_user=user, request=info.context.request)
+        return user_data
     
     @strawberry.field
     def profile(self, info: Info, username: str) -> Optional[ProfileType]:
@@ -384,28 +366,11 @@ class Query:
         # --- Part 1: Get the current user ---
         current_user = get_user(info)
         
-        # --- Part 2: The ZincSearch Query (remains the same) ---
+        # --- Part 2: The ZincSearch Query (cached per normalized prefix) ---
         if not query or len(query.strip()) < 2:
             return []
 
-        url = f"http://localhost:4080/api/profiles/_search"
-        auth = HTTPBasicAuth("admin", "Admin@123")
-        
-        search_payload = {
-                "query": {
-                    "query_string": {
-                        "query": f"{query}*", # e.g., "oma" becomes "oma*"
-                        "fields": ["username", "first_name", "last_name", "full_name", "bio"]
-                    }
-                },
-                "size": 20,
-                "_source": ["user_id"]
-            }
-        response = requests.post(url, auth=auth, json=search_payload)
-        response.raise_for_status()
-        
-        results = response.json()
-        hit_ids = [hit['_source']['user_id'] for hit in results.get('hits', {}).get('hits', [])]
+        hit_ids = search_profile_ids(query)
 
         if not hit_ids:
             return []
@@ -422,8 +387,14 @@ class Query:
         profiles_dict = {profile.user_id: profile for profile in profiles}
         ordered_profiles = [profiles_dict[id] for id in hit_ids if id in profiles_dict]
 
-        # --- Part 5: Build and return the response (remains the same) ---
-        return [build_profile_data(profile=p, current_user=current_user) for p in ordered_profiles]
+        # --- Part 5: Build and return the response ---
+        # Batch is_following into one query for the whole page (counts are denormalized columns)
+        loaders = get_loaders(info, current_user=current_user)
+        loaders.prime(ordered_profiles)
+        return [
+            build_profile_data(profile=p, current_user=current_user, loaders=loaders)
+            for p in ordered_profiles
+        ]
     
     @strawberry.field
     def conversations(self, info: Info) -> list[ConversationType]:
@@ -431,8 +402,13 @@ class Query:
 
     @strawberry.field
     def messages(
-        self, info: Info, conversation_id: str, limit: int = 50
-    ) -> list[MessageType]:
-        return services.list_messages(info, conversation_id, limit)
+        self,
+        info: Info,
+        conversation_id: str,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50,
+    ) -> MessagePage:
+        return services.list_messages(info, conversation_id, before=before, after=after, limit=limit)
         
 schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
@@ -7,6 +7,7 @@ from strawberry.types import Info
 from django.contrib.auth import get_user_model
 from apps.users.models import Profile
 from apps.chat.models import Conversation, ConversationParticipant
+from apps.graphql_api.utils import get_user
 
 User = get_user_model()
 
@@ -24,7 +25,10 @@ class ProfileType:
     is_private: bool
     created_at: datetime.datetime
     updated_at: datetime.datetime
-    avatar_url: Optional[str]
+    avatar_url: Optional[str]  # 400px
+    avatar_medium_url: Optional[str]  # 128px
+    avatar_small_url: Optional[str]  # 48px
+    avatar_status: Optional[str]  # "pending" while a new upload is processed, "failed" if it couldn't be
     age: Optional[int]
     full_name: str
     followers_count: int
@@ -87,6 +91,12 @@ class ConversationParticipantType:
             last_read_timestamp=participant_obj.last_read_timestamp
         )
         
+@strawberry.type
+class LastMessagePreviewType:
+    author_username: str
+    content: str  # truncated to 200 chars
+    timestamp: datetime.datetime
+
 @strawberry.type
 class ConversationType:
     id: strawberry.ID
@@ -95,12 +105,48 @@ class ConversationType:
 
     @strawberry.field
     def participants(self, info: Info) -> List[ConversationParticipantType]:
-        # Fetch the 'through' model objects which contain the read timestamp
-        participant_objects = self.conversationparticipant_set.all().select_related('user', 'user__profile')
-        return [ConversationParticipantType.from_instance(p) for p in participant_objects]
+        # Prefetched with user and profile by list_conversations; .all() reuses that cache
+        return [ConversationParticipantType.from_instance(p) for p in self.conversationparticipant_set.all()]
+
+    @strawberry.field
+    def last_message(self) -> Optional[LastMessagePreviewType]:
+        # Snapshot kept on the row by the chat write-behind buffer, so no Cassandra read per conversation
+        if self.last_message_at is None:
+            return None
+        return LastMessagePreviewType(
+            author_username=self.last_message_author,
+            content=self.last_message_preview,
+            timestamp=self.last_message_at,
+        )
+
+    @strawberry.field
+    def unread_count(self, info: Info) -> int:
+        user = get_user(info)
+        for participant in self.conversationparticipant_set.all():
+            if participant.user_id != user.id:
+                continue
+            # The counter is flushed behind; a newer read mark already covers it
+            if participant.last_read_timestamp and self.last_message_at \
+                    and participant.last_read_timestamp >= self.last_message_at:
+                return 0
+            return participant.unread_count
+        return 0
 
 @strawberry.type
 class MessageType:
     author_username: str
     content: str
-    timestamp: str
\ No newline at end of file
+    timestamp: str
+
+@strawberry.type
+class PageInfo:
+    has_older: bool
+    has_newer: bool
+    # Cursors of the newest and oldest message on this page
+    start_cursor: Optional[str]
+    end_cursor: Optional[str]
+
+@strawberry.type
+class MessagePage:
+    messages: List[MessageType]  # newest first
+    page_info: PageInfo
@@ -1,21 +1,13 @@
 from apps.users.models import User
-from graphql_jwt.utils import jwt_decode
+from apps.users.auth import get_request_user
 from strawberry.types import Info   # <-- NEW
 from graphql_jwt.exceptions import JSONWebTokenError, PermissionDenied
 import datetime
 import uuid
 
 def get_user(info: Info) -> User | None: 
-    request = info.context.request
-    auth = request.headers.get("authorization", "")
-    if not auth.startswith("JWT "):
-        return None
-    token = auth[4:]
-    try:
-        payload = jwt_decode(token)
-        return User.objects.get(**{User.USERNAME_FIELD: payload["username"]})
-    except Exception:
-        return None
+    # Memoized on the request and backed by the user cache, so resolvers can call this freely
+    return get_request_user(info.context.request)
     
 def jwt_error_handler(error, context):
     # convert any JWT problem into the code the Apollo link watches for
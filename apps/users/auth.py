@@ -1,39 +1,97 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from graphql_jwt.utils import jwt_decode
+from graphql_jwt.utils import jwt_decode, jwt_payload as default_jwt_payload
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.utils.encoding import smart_str
+from .jwt_cache import get_payload_cache
 
 User = get_user_model()
 
+USER_CACHE_TIMEOUT = 60  # seconds; saves invalidate explicitly (see signals.py)
+_UNRESOLVED = object()
+
+
+def user_cache_key(user_id) -> str:
+    return f"auth:user:{user_id}"
+
+
+def jwt_payload(user, context=None):
+    """graphql_jwt payload handler: adds user_id so lookups can hit the id-keyed cache."""
+    payload = default_jwt_payload(user, context)
+    payload["user_id"] = user.pk
+    return payload
+
+
+def get_user_from_payload(payload: dict):
+    """
+    Resolves a decoded JWT payload to a User, going through the Redis cache.
+    The cached instance is the bare User row; related objects (profile) are
+    never cached so they can't go stale.
+    """
+    username = payload.get(User.USERNAME_FIELD)
+    if not username:
+        return None
+
+    user_id = payload.get("user_id")
+    user = cache.get(user_cache_key(user_id)) if user_id is not None else None
+    if user is None:
+        # Tokens minted before user_id was added to the payload only carry the username
+        lookup = {"pk": user_id} if user_id is not None else {User.USERNAME_FIELD: username}
+        user = User.objects.filter(**lookup).first()
+        if user is None:
+            return None
+        cache.set(user_cache_key(user.pk), user, USER_CACHE_TIMEOUT)
+
+    if user.get_username() != username:
+        return None
+    return user
+
+
+def get_user_from_token(token: str):
+    """
+    Decodes a raw JWT and returns its User, or None if the token is bad.
+    Verified payloads are reused until their exp (see jwt_cache), so repeat
+    requests with the same token skip jwt_decode.
+    """
+    payload_cache = get_payload_cache()
+    payload = payload_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt_decode(token)
+        except Exception:
+            return None
+        payload_cache.put(token, payload)
+    return get_user_from_payload(payload)
+
+
+def get_request_user(request):
+    """
+    Returns the JWT user for an HTTP request, resolved at most once per request.
+    Expects header: Authorization: JWT <token>
+    """
+    user = getattr(request, "_jwt_user", _UNRESOLVED)
+    if user is _UNRESOLVED:
+        auth = smart_str(request.headers.get("authorization", ""))
+        user = get_user_from_token(auth[4:]) if auth.startswith("JWT ") else None
+        request._jwt_user = user
+    return user
+
 class GraphQLJWTAuthentication(BaseAuthentication):
     """
     DRF authentication class that validates GraphQL JWT tokens.
     Expects header: Authorization: JWT <token>
     """
     def authenticate(self, request):
-        auth = request.META.get('HTTP_AUTHORIZATION', '')
-        
-        if not auth:
-            return None
-            
-        auth = smart_str(auth)
+        auth = smart_str(request.META.get('HTTP_AUTHORIZATION', ''))
         if not auth.startswith('JWT '):
             return None
             
-        token = auth[4:]  # Remove 'JWT ' prefix
-        
-        try:
-            payload = jwt_decode(token)
-            username = payload.get('username')
-            if not username:
-                raise AuthenticationFailed('Invalid token')
-                
-            user = User.objects.get(**{User.USERNAME_FIELD: username})
-            return (user, token)
-            
-        except Exception as e:
+        # Shares the per-request memo with get_user on the underlying HttpRequest
+        user = get_request_user(request._request)
+        if user is None:
             raise AuthenticationFailed('Invalid or expired token')
+        return (user, auth[4:])
 
     def authenticate_header(self, request):
         return 'JWT'
\ No newline at end of file
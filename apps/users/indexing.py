@@ -0,0 +1,130 @@
+# apps/users/indexing.py
+"""
+Write-behind pipeline that keeps the ZincSearch profile index in sync.
+
+Signals only record *which* profiles changed (after the transaction commits);
+a Celery task flushes everything pending as a single `_bulk` request. Repeated
+saves of the same profile between flushes collapse into one entry, and the
+document is built from the database at flush time so it is always current.
+"""
+import json
+import logging
+import time
+from typing import Iterable, List, Tuple
+from django.db import transaction
+from socialmedia.redis_helpers import DebouncedDrain, RedisConnection
+from .models import Profile
+from .zinc import get_zinc
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1  # seconds a change may wait before it is flushed
+PENDING_KEY = "zinc:profiles:pending"          # hash: profile_id -> "index" | "delete"
+FLUSH_SCHEDULED_KEY = "zinc:profiles:flush-scheduled"
+STALE_PREFIXES_KEY = "zinc:profiles:stale-prefixes"  # set of search-cache prefixes to drop after the flush
+DEAD_LETTER_KEY = "zinc:profiles:dead-letter"  # list of JSON-encoded failed batches
+REBUILD_STATE_KEY = "zinc:profiles:rebuild"    # present while rebuild_zinc_indexes runs
+REBUILD_CHANGES_KEY = "zinc:profiles:rebuild-changes"  # hash: profile_id -> op, replayed after the swap
+
+# Records a change for the running rebuild, if there is one, in the same round trip
+JOURNAL_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+end
+"""
+
+INDEX = "index"
+DELETE = "delete"
+
+get_redis = RedisConnection("SEARCH_INDEX_REDIS_URL")
+_journal = get_redis.register_script(JOURNAL_SCRIPT)
+flush_schedule = DebouncedDrain(get_redis, FLUSH_SCHEDULED_KEY, FLUSH_INTERVAL)
+
+
+def profile_document(profile: Profile) -> dict:
+    return {
+        "user_id": profile.user.id,
+        "username": profile.user.username,
+        "first_name": profile.first_name,
+        "last_name": profile.last_name,
+        "full_name": profile.full_name,
+        "bio": profile.bio,
+    }
+
+
+# ---------- Producer side (signals) ----------
+def queue_profile_index(profile_id: int, stale_prefixes: Iterable[str] = ()) -> None:
+    stale_prefixes = list(stale_prefixes)
+    transaction.on_commit(lambda: _enqueue(profile_id, INDEX, stale_prefixes))
+
+
+def queue_profile_delete(profile_id: int, stale_prefixes: Iterable[str] = ()) -> None:
+    stale_prefixes = list(stale_prefixes)
+    transaction.on_commit(lambda: _enqueue(profile_id, DELETE, stale_prefixes))
+
+
+def _enqueue(profile_id: int, op: str, stale_prefixes: List[str]) -> None:
+    from .tasks import flush_profile_index_task  # avoid circular import
+
+    try:
+        client = get_redis()
+        pipe = client.pipeline()
+        pipe.hset(PENDING_KEY, profile_id, op)
+        _journal(keys=[REBUILD_STATE_KEY, REBUILD_CHANGES_KEY], args=[profile_id, op], client=pipe)
+        if stale_prefixes:
+            pipe.sadd(STALE_PREFIXES_KEY, *stale_prefixes)
+        pipe.execute()
+        flush_schedule.schedule(flush_profile_index_task, client)
+    except Exception:
+        # Search freshness must never break the write path; rebuild_zinc_indexes repairs gaps
+        logger.exception("Could not queue profile %s for ZincSearch %s", profile_id, op)
+
+
+# ---------- Consumer side (Celery task) ----------
+def take_pending() -> Tuple[dict, List[str]]:
+    """
+    Atomically claims everything queued so far.
+    Returns ({profile_id: op}, [search-cache prefixes to invalidate once it is indexed]).
+    """
+    flush_schedule.clear()
+    pipe = get_redis().pipeline()
+    pipe.hgetall(PENDING_KEY)
+    pipe.smembers(STALE_PREFIXES_KEY)
+    pipe.delete(PENDING_KEY, STALE_PREFIXES_KEY)
+    pending, prefixes, _ = pipe.execute()
+    return pending, sorted(prefixes)
+
+
+def build_bulk_actions(batch: dict, *index_names: str) -> List[dict]:
+    """Turns {profile_id: op} into Zinc `_bulk` lines for each index, reading documents fresh from Postgres."""
+    index_ids = [int(pid) for pid, op in batch.items() if op == INDEX]
+    profiles = {
+        p.id: p for p in Profile.objects.filter(id__in=index_ids).select_related("user")
+    }
+
+    lines = []
+    for pid, op in batch.items():
+        profile = profiles.get(int(pid))
+        document = profile_document(profile) if op == INDEX and profile is not None else None
+        for index_name in index_names:
+            if document is not None:
+                lines.append({"index": {"_index": index_name, "_id": str(pid)}})
+                lines.append(document)
+            else:
+                # Deleted, or gone from the database since it was queued
+                lines.append({"delete": {"_index": index_name, "_id": str(pid)}})
+    return lines
+
+
+def send_bulk(batch: dict) -> None:
+    zinc = get_zinc()
+    zinc.bulk(build_bulk_actions(batch, *zinc.write_indexes()))
+
+
+def dead_letter(batch: dict, stale_prefixes: List[str], error: Exception) -> None:
+    get_redis().rpush(DEAD_LETTER_KEY, json.dumps({
+        "batch": batch,
+        "stale_prefixes": stale_prefixes,
+        "error": str(error),
+        "failed_at": time.time(),
+    }))
@@ -0,0 +1,92 @@
+# apps/users/jwt_cache.py
+"""
+Per-process LRU of verified JWT payloads.
+
+A page load sends the same access token with every GraphQL request and
+websocket connect; this lets all but the first skip jwt_decode's HMAC check
+and claim parsing. Entries are keyed by a SHA-256 of the token (raw tokens
+never sit in memory as keys) and are dropped at the token's own `exp`, so a
+cached payload is never served past the moment jwt_decode would reject it.
+`stats()` reports hit ratio and evictions; staff can read it at /api/users/stats/.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class PayloadCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # digest -> (payload, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, exp = entry
+            if exp <= time.time():
+                del self._entries[digest]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: dict) -> None:
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)):
+            return  # without an expiry there is nothing safe to bound the entry by
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (payload, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_cache: Optional[PayloadCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_payload_cache() -> PayloadCache:
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+
+        with _cache_lock:
+            if _cache is None:
+                _cache = PayloadCache(settings.JWT_PAYLOAD_CACHE_SIZE)
+    return _cache
@@ -0,0 +1,168 @@
+# apps/users/mailer.py
+"""
+Batched outgoing email.
+
+The request path pushes only a template name, a user id and a tiny context
+(well under 200 bytes) onto a Redis list; a Celery task drains
+it in groups of BATCH_SIZE and sends every group over one SMTP session from
+get_connection(), so a signup burst pays one TLS handshake per group instead
+of one per message. Workers look the recipients up in one query and render
+from templates compiled once per process. A message that fails is handed to
+send_templated_mail_task, which retries it on its own; the rest of the group
+carries on.
+"""
+import json
+import logging
+from functools import lru_cache
+from typing import List, Tuple
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from socialmedia.redis_helpers import DebouncedDrain, RedisConnection
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 1  # seconds a message may wait for others to share its connection
+MAX_BATCHES_PER_RUN = 20  # then reschedule, so one burst can't pin a worker
+OUTBOX_KEY = "mail:outbox"                  # list of JSON-encoded messages
+FLUSH_SCHEDULED_KEY = "mail:flush-scheduled"
+STATS_KEY = "mail:stats"                    # hash: sent, failed, skipped, seconds
+
+# Template base name (users/<name>.txt / .html) -> subject
+EMAIL_TEMPLATES = {
+    "email_verify": "Verify your account",
+    "password_reset": "Password reset",
+}
+
+get_redis = RedisConnection("MAIL_QUEUE_REDIS_URL")
+drain_schedule = DebouncedDrain(get_redis, FLUSH_SCHEDULED_KEY, FLUSH_INTERVAL)
+
+
+# ---------- Producer side ----------
+def queue_mail(*, template: str, user_id: int, context: dict) -> None:
+    """Queues `template` for user_id. `context` must be small and JSON-safe; the worker adds the user."""
+    from .tasks import send_mail_batch_task, send_templated_mail_task  # avoid circular import
+
+    if template not in EMAIL_TEMPLATES:
+        raise ValueError(f"Unknown email template {template!r}")
+    message = {"template": template, "user_id": user_id, "context": context}
+    try:
+        client = get_redis()
+        client.rpush(OUTBOX_KEY, json.dumps(message, separators=(",", ":")))
+        drain_schedule.schedule(send_mail_batch_task, client)
+    except redis.RedisError:
+        # Verification and reset codes must still go out; fall back to one task per message
+        logger.exception("Could not queue email for batching; sending it directly")
+        send_templated_mail_task.delay(message)
+
+
+# ---------- Consumer side (Celery task) ----------
+def take_batch(size: int = BATCH_SIZE) -> List[dict]:
+    """Atomically claims up to `size` queued messages."""
+    pipe = get_redis().pipeline()
+    pipe.lrange(OUTBOX_KEY, 0, size - 1)
+    pipe.ltrim(OUTBOX_KEY, size, -1)
+    raw, _ = pipe.execute()
+    return [json.loads(item) for item in raw]
+
+
+def requeue(messages: List[dict]) -> None:
+    if messages:
+        get_redis().lpush(OUTBOX_KEY, *[json.dumps(m, separators=(",", ":")) for m in reversed(messages)])
+
+
+@lru_cache(maxsize=None)
+def compiled_templates(template: str) -> Tuple:
+    """(text, html) Template objects, parsed once per worker process."""
+    return get_template(f"users/{template}.txt"), get_template(f"users/{template}.html")
+
+
+def precompile_templates() -> None:
+    for template in EMAIL_TEMPLATES:
+        compiled_templates(template)
+
+
+def build_message(message: dict, user, connection=None) -> EmailMultiAlternatives:
+    text_template, html_template = compiled_templates(message["template"])
+    context = {"username": user.username, **message["context"]}
+    email = EmailMultiAlternatives(
+        EMAIL_TEMPLATES[message["template"]],
+        text_template.render(context),
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email],
+        connection=connection,
+    )
+    email.attach_alternative(html_template.render(context), "text/html")
+    return email
+
+
+def send_batch(messages: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """
+    Sends `messages` over one SMTP session. Returns (failed, skipped): skipped
+    messages name a user that no longer exists and are not retried.
+    Raises if the session can't be opened at all, so the caller can requeue the group.
+    """
+    users = get_user_model().objects.only("username", "email").in_bulk(
+        {message["user_id"] for message in messages}
+    )
+    failed = []
+    skipped = []
+    connection = get_connection(fail_silently=False)
+    connection.open()
+    try:
+        for position, message in enumerate(messages):
+            user = users.get(message["user_id"])
+            if user is None:
+                # Queued only after commit, so the account was deleted since
+                logger.warning("Dropping %s email for missing user %s", message["template"], message["user_id"])
+                skipped.append(message)
+                continue
+            try:
+                connection.send_messages([build_message(message, user, connection)])
+            except Exception:
+                logger.exception("Sending %s email to user %s failed", message["template"], message["user_id"])
+                failed.append(message)
+                # The session may be dead after an SMTP error; start a fresh one for the rest
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception:
+                    logger.exception("Could not reopen the SMTP session")
+                    failed.extend(messages[position + 1:])
+                    break
+    finally:
+        connection.close()
+    return failed, skipped
+
+
+# ---------- Metrics ----------
+def record_stats(*, sent: int, failed: int, skipped: int, seconds: float) -> None:
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hincrby(STATS_KEY, "sent", sent)
+        pipe.hincrby(STATS_KEY, "failed", failed)
+        pipe.hincrby(STATS_KEY, "skipped", skipped)
+        pipe.hincrbyfloat(STATS_KEY, "seconds", seconds)
+        pipe.execute()
+    except redis.RedisError:
+        logger.exception("Could not record email stats")
+    logger.info("Sent %s emails (%s failed, %s skipped) in %.2fs, %.1f msg/s",
+                sent, failed, skipped, seconds, sent / max(seconds, 1e-6))
+
+
+def mail_stats() -> dict:
+    """Lifetime totals plus messages/s across the time spent sending."""
+    stats = get_redis().hgetall(STATS_KEY)
+    sent = int(stats.get("sent", 0))
+    seconds = float(stats.get("seconds", 0))
+    return {
+        "sent": sent,
+        "failed": int(stats.get("failed", 0)),
+        "skipped": int(stats.get("skipped", 0)),
+        "seconds": seconds,
+        "messages_per_second": sent / seconds if seconds else 0.0,
+        "queued": get_redis().llen(OUTBOX_KEY),
+    }
@@ -1,64 +1,190 @@
 # apps/users/management/commands/rebuild_zinc_index.py
-import requests
-from requests.auth import HTTPBasicAuth
-from django.core.management.base import BaseCommand
-from apps.users.models import Profile
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.users.models import Profile
+from apps.users.indexing import (
+    profile_document, build_bulk_actions, get_redis, REBUILD_STATE_KEY, REBUILD_CHANGES_KEY,
+)
+from apps.users.zinc import get_zinc, ZincError, WRITE_TARGET_TTL
+BULK_TIMEOUT = (2, 60)  # bulk chunks take far longer than a search
 
-ZINC_HOST = "http://localhost:4080"
-ZINC_USER = "admin"
-ZINC_PASSWORD = "Admin@123"
-INDEX_NAME = "profiles"
 
 class Command(BaseCommand):
-    help = 'Rebuilds the ZincSearch index for user profiles.'
-    
+    help = ('Rebuilds the ZincSearch profile index into a new versioned index, '
+            'then swaps the alias over to it with no search downtime.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Profiles per _bulk request.')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent _bulk requests in flight.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue the last interrupted rebuild instead of starting over.')
+        parser.add_argument('--keep-old', action='store_true',
+                            help="Don't delete the previous index after the swap.")
+
     def handle(self, *args, **options):
-        auth = HTTPBasicAuth(ZINC_USER, ZINC_PASSWORD)
-        headers = {"Content-Type": "application/json"}
-
-        self.stdout.write("Connecting to ZincSearch...")
-
-        # Step 1: Delete old index (if it exists)
-        self.stdout.write(f"Deleting old index '{INDEX_NAME}'...")
-        delete_url = f"{ZINC_HOST}/api/index/{INDEX_NAME}"
-        requests.delete(delete_url, auth=auth) # It's okay if this fails with a 404
-
-        # Step 2: Create new index
-        self.stdout.write(f"Creating new index '{INDEX_NAME}'...")
-        create_url = f"{ZINC_HOST}/api/index"
-        index_payload = {
-            "name": INDEX_NAME,
-            "storage_type": "disk"
-        }
-        response = requests.put(create_url, auth=auth, headers=headers, json=index_payload)
-        response.raise_for_status() # Will fail if creation doesn't work
-
-        # Step 3: Bulk insert documents
+        self.zinc = get_zinc()
+        alias = self.zinc.index_name
+        redis = get_redis()
+
+        state = json.loads(redis.get(REBUILD_STATE_KEY) or "null")
+        if options['resume']:
+            if not state:
+                raise CommandError("No interrupted rebuild to resume.")
+            self.stdout.write(f"Resuming into '{state['index']}' after profile {state['last_pk']}...")
+        else:
+            if state:
+                self._discard_interrupted(alias, state)
+            version = timezone.now().strftime('%Y%m%d%H%M%S')
+            state = {
+                "index": f"{alias}_v{version}",
+                "last_pk": 0,
+                "indexed": 0,
+                "started_at": timezone.now().isoformat(),
+            }
+            self.stdout.write(f"Creating new index '{state['index']}'...")
+            self.zinc.create_index(state['index'])
+            # From here on the indexing pipeline journals every change (deletes and
+            # username edits included) for _catch_up to replay into the new index
+            redis.delete(REBUILD_CHANGES_KEY)
+            redis.set(REBUILD_STATE_KEY, json.dumps(state))
+
+        # Step 1: Stream profiles into the new index while the old one keeps serving
+        self._stream(state, options['chunk_size'], options['workers'], redis)
+
+        # Step 2: Don't swap until Zinc reports every document we sent
+        self._wait_for_count(state['index'], state['indexed'])
+
+        # Step 3: Atomically point the alias at the new index
+        old_indexes = self._swap(alias, state['index'])
+
+        # Step 4: Replay anything changed mid-rebuild (it was written to the old index)
+        self._catch_up(state, redis)
+
+        if not options['keep_old']:
+            for name in old_indexes:
+                self.stdout.write(f"Deleting old index '{name}'...")
+                self.zinc.delete_index(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully indexed {state['indexed']} documents into '{state['index']}'."
+        ))
+
+    def _discard_interrupted(self, alias, state):
+        """Starting over: drops the half-built index an interrupted run left behind."""
+        orphan = state['index']
+        if orphan in self.zinc.alias_targets(alias):
+            # It got as far as the swap, so it is serving; this run replaces it like any old index
+            self.stdout.write(f"Previous rebuild into '{orphan}' was interrupted after the swap; starting over.")
+            return
+        if self.zinc.index_exists(orphan):
+            self.stdout.write(self.style.WARNING(
+                f"Deleting '{orphan}' left by an interrupted rebuild (use --resume to continue it instead)..."
+            ))
+            self.zinc.delete_index(orphan)
+
+    def _chunks(self, last_pk, chunk_size):
+        profiles = (
+            Profile.objects.filter(pk__gt=last_pk)
+            .select_related('user').order_by('pk')
+            .iterator(chunk_size=chunk_size)
+        )
+        chunk = []
+        for profile in profiles:
+            chunk.append(profile)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _bulk_actions(self, index_name, profiles):
+        actions = []
+        for profile in profiles:
+            actions.append({"index": {"_index": index_name, "_id": str(profile.id)}})  # ID must be a string
+            actions.append(profile_document(profile))
+        return actions
+
+    def _stream(self, state, chunk_size, workers, redis):
         self.stdout.write("Indexing profiles...")
-        bulk_url = f"{ZINC_HOST}/api/_bulk"
-        
-        bulk_data = []
-        for profile in Profile.objects.all().select_related('user'):
-            bulk_data.append({
-                "index": {
-                    "_index": INDEX_NAME,
-                    "_id": str(profile.id) # ID must be a string
-                }
-            })
-            bulk_data.append({
-                "user_id": profile.user.id,
-                "username": profile.user.username,
-                "first_name": profile.first_name,
-                "last_name": profile.last_name,
-                "full_name": profile.full_name,
-                "bio": profile.bio,
-            })
-            
-        # ZincSearch's _bulk format needs newline-delimited JSON
-        bulk_payload = "\n".join(json.dumps(item) for item in bulk_data) + "\n"
-
-        response = requests.post(bulk_url, auth=auth, headers={"Content-Type": "application/json"}, data=bulk_payload)
-        response.raise_for_status()
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully indexed {len(bulk_data) // 2} documents."))
\ No newline at end of file
+        started = time.monotonic()
+        sent_this_run = 0
+        in_flight = deque()
+
+        def settle(oldest):
+            # Chunks settle in submission order, so last_pk is always a safe resume point
+            nonlocal sent_this_run
+            future, last_pk, size = oldest
+            future.result()
+            state['last_pk'] = last_pk
+            state['indexed'] += size
+            sent_this_run += size
+            redis.set(REBUILD_STATE_KEY, json.dumps(state))
+            rate = sent_this_run / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"  {state['indexed']} indexed ({rate:.0f} docs/s)")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                for chunk in self._chunks(state['last_pk'], chunk_size):
+                    actions = self._bulk_actions(state['index'], chunk)
+                    future = pool.submit(self.zinc.bulk, actions, timeout=BULK_TIMEOUT)
+                    in_flight.append((future, chunk[-1].pk, len(chunk)))
+                    # Bound memory: never hold more than ~2 chunks per worker
+                    if len(in_flight) >= workers * 2:
+                        settle(in_flight.popleft())
+                while in_flight:
+                    settle(in_flight.popleft())
+            except ZincError as exc:
+                for future, _, _ in in_flight:
+                    future.cancel()
+                raise CommandError(
+                    f"Bulk indexing failed after profile {state['last_pk']}: {exc}. "
+                    f"Re-run with --resume to continue."
+                )
+
+    def _wait_for_count(self, index_name, expected, timeout=60):
+        deadline = time.monotonic() + timeout
+        while True:
+            count = self.zinc.doc_count(index_name)
+            if count >= expected:
+                self.stdout.write(f"Document counts match ({count}/{expected}).")
+                return
+            if time.monotonic() > deadline:
+                raise CommandError(
+                    f"'{index_name}' has {count} of {expected} documents; not swapping. "
+                    f"Re-run with --resume once Zinc catches up."
+                )
+            time.sleep(1)
+
+    def _swap(self, alias, new_index):
+        old_indexes = [name for name in self.zinc.alias_targets(alias) if name != new_index]
+        if not old_indexes and self.zinc.index_exists(alias):
+            # First run after moving to aliases: a concrete index still owns the name.
+            # It has to go before the alias can exist, so search blips just this once.
+            self.stdout.write(self.style.WARNING(f"Replacing concrete index '{alias}' with an alias..."))
+            self.zinc.delete_index(alias)
+
+        self.stdout.write(f"Pointing alias '{alias}' at '{new_index}'...")
+        actions = [{"remove": {"index": name, "alias": alias}} for name in old_indexes]
+        actions.append({"add": {"index": new_index, "alias": alias}})
+        self.zinc.update_aliases(actions)
+        return old_indexes
+
+    def _catch_up(self, state, redis):
+        # Workers cache their write target; keep journaling until every one of
+        # them has re-resolved the alias and writes to the new index
+        self.stdout.write(f"Waiting {WRITE_TARGET_TTL}s for workers to pick up the new index...")
+        time.sleep(WRITE_TARGET_TTL)
+
+        # Anything journaled after this read already went to the new index directly
+        changes = redis.hgetall(REBUILD_CHANGES_KEY)
+        if changes:
+            self.stdout.write(f"Replaying {len(changes)} profile changes made during the rebuild...")
+            # Deletes replay as deletes; a failure here leaves the journal for --resume
+            self.zinc.bulk(build_bulk_actions(changes, state['index']), timeout=BULK_TIMEOUT)
+        redis.delete(REBUILD_STATE_KEY, REBUILD_CHANGES_KEY)
@@ -0,0 +1,69 @@
+# apps/users/management/commands/reconcile_follow_counts.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from apps.users.models import Profile
+
+Follow = Profile.following.through
+
+
+class Command(BaseCommand):
+    help = 'Repairs drift in the denormalized Profile followers_count / following_count columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Profiles locked and checked per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without writing anything.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        last_pk = 0
+        scanned = repaired = 0
+
+        # Keyset pagination over pk so memory stays flat no matter how many profiles exist
+        while True:
+            with transaction.atomic():
+                # Locking the chunk serializes us against in-flight follow/unfollow
+                # transactions, which take the same row locks to bump the counters.
+                chunk = list(
+                    Profile.objects.select_for_update()
+                    .filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'followers_count', 'following_count')[:chunk_size]
+                )
+                if not chunk:
+                    break
+                ids = [pk for pk, _, _ in chunk]
+                followers = dict(
+                    Follow.objects.filter(to_profile_id__in=ids)
+                    .values('to_profile_id').annotate(n=Count('id'))
+                    .values_list('to_profile_id', 'n')
+                )
+                following = dict(
+                    Follow.objects.filter(from_profile_id__in=ids)
+                    .values('from_profile_id').annotate(n=Count('id'))
+                    .values_list('from_profile_id', 'n')
+                )
+
+                drifted = []
+                for pk, stored_followers, stored_following in chunk:
+                    actual_followers = followers.get(pk, 0)
+                    actual_following = following.get(pk, 0)
+                    if (stored_followers, stored_following) != (actual_followers, actual_following):
+                        drifted.append(Profile(
+                            pk=pk,
+                            followers_count=actual_followers,
+                            following_count=actual_following,
+                        ))
+
+                if drifted and not dry_run:
+                    Profile.objects.bulk_update(drifted, ['followers_count', 'following_count'])
+
+            scanned += len(chunk)
+            repaired += len(drifted)
+            last_pk = chunk[-1][0]
+            self.stdout.write(f"Checked {scanned} profiles, {repaired} drifted...")
+
+        verb = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {repaired} of {scanned} profiles."))
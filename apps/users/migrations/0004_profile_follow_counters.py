@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counters(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Follow = Profile.following.through
+
+    followers = (
+        Follow.objects.filter(to_profile_id=OuterRef('pk'))
+        .values('to_profile_id').annotate(n=Count('id')).values('n')
+    )
+    following = (
+        Follow.objects.filter(from_profile_id=OuterRef('pk'))
+        .values('from_profile_id').annotate(n=Count('id')).values('n')
+    )
+    Profile.objects.update(
+        followers_count=Coalesce(Subquery(followers), Value(0)),
+        following_count=Coalesce(Subquery(following), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+def mark_existing_avatars_ready(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    # Pre-pipeline avatars are already a processed 400px JPEG; the smaller
+    # sizes fall back to it until the user uploads again
+    Profile.objects.exclude(avatar='').exclude(avatar__isnull=True).update(avatar_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_profile_follow_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_medium',
+            field=models.ImageField(blank=True, null=True, upload_to='avatars/'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_small',
+            field=models.ImageField(blank=True, null=True, upload_to='avatars/'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_upload',
+            field=models.FileField(blank=True, null=True, upload_to='avatars/uploads/'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10),
+        ),
+        migrations.RunPython(mark_existing_avatars_ready, migrations.RunPython.noop),
+    ]
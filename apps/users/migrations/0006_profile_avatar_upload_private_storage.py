@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:10
+
+import apps.users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_profile_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar_upload',
+            field=models.FileField(blank=True, null=True, storage=apps.users.models.private_upload_storage, upload_to='avatars/uploads/'),
+        ),
+    ]
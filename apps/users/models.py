@@ -2,6 +2,12 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 import uuid
 
+def private_upload_storage():
+    """Outside MEDIA_ROOT: raw avatar uploads (EXIF/GPS included) are never served."""
+    from django.conf import settings
+    from django.core.files.storage import FileSystemStorage
+    return FileSystemStorage(location=settings.PRIVATE_MEDIA_ROOT)
+
 def otp_default():
     return uuid.uuid4().hex[:6].upper()
 
@@ -23,6 +29,16 @@ class Profile(models.Model):
         (MALE, 'Male'),
         (FEMALE, 'Female'),
     ]
+
+    # Avatar processing states
+    AVATAR_PENDING = 'pending'
+    AVATAR_READY = 'ready'
+    AVATAR_FAILED = 'failed'
+    AVATAR_STATUS_CHOICES = [
+        (AVATAR_PENDING, 'Pending'),
+        (AVATAR_READY, 'Ready'),
+        (AVATAR_FAILED, 'Failed'),
+    ]
     
     user = models.OneToOneField(
         'User', 
@@ -39,7 +55,14 @@ class Profile(models.Model):
     
     # Social info
     bio = models.TextField(max_length=500, blank=True)
-    avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)  # 400px
+    avatar_medium = models.ImageField(upload_to='avatars/', blank=True, null=True)  # 128px
+    avatar_small = models.ImageField(upload_to='avatars/', blank=True, null=True)  # 48px
+    # Raw upload waiting for process_avatar_task; cleared once the renditions exist
+    avatar_upload = models.FileField(
+        upload_to='avatars/uploads/', storage=private_upload_storage, blank=True, null=True
+    )
+    avatar_status = models.CharField(max_length=10, choices=AVATAR_STATUS_CHOICES, blank=True)
     website = models.URLField(blank=True)
     is_private = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -59,6 +82,11 @@ class Profile(models.Model):
         blank=True
     )
 
+    # Denormalized follow counters, kept in step by the follow/unfollow/block services.
+    # Only ever touch these through F() updates; `reconcile_follow_counts` repairs drift.
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return f"{self.user.username}'s profile"
     
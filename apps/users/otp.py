@@ -0,0 +1,116 @@
+# apps/users/otp.py
+"""
+One-time codes for email verification and password reset.
+
+OTP_STORE picks the backend. RedisOTPStore (the default) keeps one key per
+(purpose, user) with a native TTL, so expired codes vanish on their own and
+OTP churn never writes to Postgres. Verifying is an atomic compare-and-delete,
+so a code can be redeemed exactly once even under concurrent requests.
+DatabaseOTPStore keeps the original UserOTP table behaviour.
+"""
+import threading
+from datetime import timedelta
+import redis
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import UserOTP, otp_default
+
+OTP_TTL = 900  # 15 min
+
+
+class OTPStore:
+    def issue(self, *, user_id: int, purpose: str) -> str:
+        """Creates a fresh code for (user, purpose), replacing any outstanding one."""
+        raise NotImplementedError
+
+    def get_or_issue(self, *, user_id: int, purpose: str) -> str:
+        """The outstanding code if there is one, otherwise a fresh one."""
+        raise NotImplementedError
+
+    def consume(self, *, user_id: int, purpose: str, code: str) -> bool:
+        """True, and the code is gone, if `code` is the live code for (user, purpose)."""
+        raise NotImplementedError
+
+
+class RedisOTPStore(OTPStore):
+    # Delete only if the stored code matches, in one server-side step
+    COMPARE_AND_DELETE = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str):
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self._compare_and_delete = self.redis.register_script(self.COMPARE_AND_DELETE)
+
+    @staticmethod
+    def key(user_id: int, purpose: str) -> str:
+        # purpose is UserOTP.VERIFY / UserOTP.RESET
+        return f"otp:{purpose}:{user_id}"
+
+    def issue(self, *, user_id, purpose):
+        code = otp_default()
+        self.redis.set(self.key(user_id, purpose), code, ex=OTP_TTL)
+        return code
+
+    def get_or_issue(self, *, user_id, purpose):
+        key = self.key(user_id, purpose)
+        # SET NX keeps a live code (and its TTL); GET then returns whichever code won
+        pipe = self.redis.pipeline()
+        pipe.set(key, otp_default(), ex=OTP_TTL, nx=True)
+        pipe.get(key)
+        _, code = pipe.execute()
+        return code
+
+    def consume(self, *, user_id, purpose, code):
+        return bool(self._compare_and_delete(keys=[self.key(user_id, purpose)], args=[code]))
+
+
+class DatabaseOTPStore(OTPStore):
+    @staticmethod
+    def _cutoff():
+        return timezone.now() - timedelta(seconds=OTP_TTL)
+
+    def issue(self, *, user_id, purpose):
+        UserOTP.objects.filter(user_id=user_id, purpose=purpose).delete()
+        return UserOTP.objects.create(user_id=user_id, purpose=purpose).token
+
+    def get_or_issue(self, *, user_id, purpose):
+        # An expired code counts as none: drop it so get_or_create issues a fresh one
+        UserOTP.objects.filter(user_id=user_id, purpose=purpose, created__lt=self._cutoff()).delete()
+        otp, _ = UserOTP.objects.get_or_create(
+            user_id=user_id, purpose=purpose, defaults={"token": otp_default()}
+        )
+        return otp.token
+
+    def consume(self, *, user_id, purpose, code):
+        # The conditional DELETE is the compare-and-swap: only one request can remove the row
+        deleted, _ = UserOTP.objects.filter(
+            user_id=user_id, purpose=purpose, token=code, created__gte=self._cutoff(),
+        ).delete()
+        return bool(deleted)
+
+    def purge_expired(self) -> int:
+        """Deletes every expired row; codes nobody redeemed otherwise stay forever."""
+        deleted, _ = UserOTP.objects.filter(created__lt=self._cutoff()).delete()
+        return deleted
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store() -> OTPStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_class = import_string(settings.OTP_STORE)
+                if issubclass(store_class, RedisOTPStore):
+                    _store = store_class(settings.OTP_REDIS_URL)
+                else:
+                    _store = store_class()
+    return _store
@@ -0,0 +1,205 @@
+# apps/users/prefix_index.py
+"""
+In-process prefix index over usernames and first/last names.
+
+Lets search_profiles answer very short prefixes locally and keep working
+when ZincSearch is slow or down. Each worker process holds its own copy:
+two parallel arrays sorted by (term, user_id) - a list of term strings
+(deduplicated, so the many users sharing a first name share one str) and an
+array('q') of user ids. A prefix lookup is one bisect plus a short scan.
+
+Memory, measured with tracemalloc on 1M synthetic profiles (unique usernames
+of 6-14 chars, first/last names drawn from 5k/20k distinct names, 90% of
+profiles with each; 2.8M entries, 1.02M distinct terms): ~108 MB steady state
+per worker, roughly
+  - 8 B list slot + 8 B id per (term, user) entry    ~ 45 MB
+  - one str per *distinct* term (mostly usernames)   ~ 61 MB
+The build peaks at ~350 MB while the (term, id) pairs are sorted.
+`stats()` reports the live numbers, served to staff at /api/users/stats/.
+
+Saves in this process update the index from the profile signals once they
+commit; saves handled by other workers reach it through the periodic rebuild.
+The refresh thread starts lazily on the first search in each process.
+"""
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BUILD_CHUNK_SIZE = 2000
+MAX_SCAN = 10_000  # entries scanned per word; keeps 2-letter prefixes cheap
+REFRESH_INTERVAL = 15 * 60  # seconds between background rebuilds
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._terms: List[str] = []
+        self._ids = array("q")
+        self._lock = threading.RLock()
+        self._ready = False
+        self._refresh_pid: Optional[int] = None
+        # Kept current by build/_add/_remove so stats() never walks the arrays
+        self._distinct_terms = 0
+        self._term_bytes = 0
+        self.built_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    # ---------- Building ----------
+    def build(self) -> None:
+        """(Re)builds from a streamed Profile query, then swaps the arrays in."""
+        from .models import Profile
+        from .search import tokens
+
+        started = time.monotonic()
+        interned = {}
+        pairs = []
+        rows = (
+            Profile.objects.values_list("user_id", "user__username", "first_name", "last_name")
+            .iterator(chunk_size=BUILD_CHUNK_SIZE)
+        )
+        for user_id, username, first_name, last_name in rows:
+            for term in tokens(username, first_name, last_name):
+                pairs.append((interned.setdefault(term, term), user_id))
+        pairs.sort()
+
+        terms = [term for term, _ in pairs]
+        ids = array("q", (user_id for _, user_id in pairs))
+        del pairs
+        term_bytes = sum(sys.getsizeof(term) for term in interned)
+        with self._lock:
+            self._terms, self._ids = terms, ids
+            self._distinct_terms, self._term_bytes = len(interned), term_bytes
+            self._ready = True
+            self.built_at = time.time()
+        logger.info("Profile prefix index built: %s entries in %.1fs", len(terms), time.monotonic() - started)
+
+    def start_background_refresh(self) -> None:
+        """
+        Builds now and then every REFRESH_INTERVAL seconds on a daemon thread.
+        Safe to call on every search: it starts one thread per process, and a
+        forked worker (e.g. gunicorn --preload) starts its own since threads
+        don't survive fork.
+        """
+        pid = os.getpid()
+        if self._refresh_pid == pid:
+            return
+        with self._lock:
+            if self._refresh_pid == pid:
+                return
+            self._refresh_pid = pid
+
+        def run():
+            from django.db import connection
+
+            while True:
+                try:
+                    self.build()
+                except Exception:
+                    logger.exception("Profile prefix index build failed")
+                finally:
+                    connection.close()  # don't hold a Postgres connection while sleeping
+                time.sleep(REFRESH_INTERVAL)
+
+        threading.Thread(target=run, name="profile-prefix-index", daemon=True).start()
+
+    # ---------- Incremental updates ----------
+    def _add(self, term: str, user_id: int) -> None:
+        pos = self._position(term, user_id)
+        if pos < len(self._terms) and self._terms[pos] == term and self._ids[pos] == user_id:
+            return
+        existing = self._neighbour_term(pos, term)
+        if existing is None:
+            self._distinct_terms += 1
+            self._term_bytes += sys.getsizeof(term)
+        else:
+            term = existing  # share the str object, as build() does
+        self._terms.insert(pos, term)
+        self._ids.insert(pos, user_id)
+
+    def _remove(self, term: str, user_id: int) -> None:
+        pos = self._position(term, user_id)
+        if pos < len(self._terms) and self._terms[pos] == term and self._ids[pos] == user_id:
+            removed = self._terms[pos]
+            del self._terms[pos]
+            del self._ids[pos]
+            if self._neighbour_term(pos, term) is None:
+                self._distinct_terms -= 1
+                self._term_bytes -= sys.getsizeof(removed)
+
+    def _neighbour_term(self, pos: int, term: str) -> Optional[str]:
+        # `pos` lies within (or at the edge of) term's run, so any other entry for it is adjacent
+        for i in (pos - 1, pos):
+            if 0 <= i < len(self._terms) and self._terms[i] == term:
+                return self._terms[i]
+        return None
+
+    def _position(self, term: str, user_id: int) -> int:
+        # First slot for `term`, then walk its (id-sorted) run to find user_id's place
+        pos = bisect.bisect_left(self._terms, term)
+        end = bisect.bisect_right(self._terms, term, lo=pos)
+        while pos < end and self._ids[pos] < user_id:
+            pos += 1
+        return pos
+
+    def replace(self, user_id: int, old_terms: Iterable[str], new_terms: Iterable[str]) -> None:
+        """Moves one user's entries from old_terms to new_terms. No-op until the first build."""
+        old_terms, new_terms = set(old_terms), set(new_terms)
+        with self._lock:
+            if not self._ready:
+                return
+            for term in old_terms - new_terms:
+                self._remove(term, user_id)
+            for term in new_terms - old_terms:
+                self._add(term, user_id)
+
+    # ---------- Lookups ----------
+    def _ids_for_prefix(self, prefix: str, limit: int = MAX_SCAN) -> List[int]:
+        found = {}
+        pos = bisect.bisect_left(self._terms, prefix)
+        end = min(len(self._terms), pos + MAX_SCAN)
+        while pos < end and len(found) < limit and self._terms[pos].startswith(prefix):
+            found.setdefault(self._ids[pos], None)
+            pos += 1
+        return list(found)
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """
+        User ids with a name word starting with every word of `query`, in term
+        order (so an exact match comes before longer words it prefixes).
+        """
+        from .search import tokens
+
+        # Drive the scan with the most selective (longest) word
+        words = sorted(tokens(query), key=len, reverse=True)
+        if not words:
+            return []
+        with self._lock:
+            if len(words) == 1:
+                return self._ids_for_prefix(words[0], limit)
+            results = self._ids_for_prefix(words[0])
+            for word in words[1:]:
+                allowed = set(self._ids_for_prefix(word))
+                results = [user_id for user_id in results if user_id in allowed]
+        return results[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self._ready,
+                "entries": len(self._terms),
+                "distinct_terms": self._distinct_terms,
+                "bytes": sys.getsizeof(self._terms) + sys.getsizeof(self._ids) + self._term_bytes,
+                "built_at": self.built_at,
+            }
+
+
+prefix_index = PrefixIndex()
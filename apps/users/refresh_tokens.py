@@ -0,0 +1,177 @@
+# apps/users/refresh_tokens.py
+"""
+Refresh-token issue, rotation and revocation served from Redis.
+
+Every issued token still gets its graphql_jwt RefreshToken row (the audit
+trail), but validity lives in BLACKLIST_REDIS_URL:
+
+  refresh:live:<sha256(token)>     -> user id, TTL = JWT_REFRESH_EXPIRATION_DELTA
+  refresh:revoked:<sha256(token)>  -> "1", TTL = what was left of the token's lifetime
+
+Keys hold a digest, never the token itself, so anyone who can list keys on
+that Redis can't lift usable credentials.
+
+Rotation is a single Lua call that checks the old token, revokes it and
+registers its replacement, so the refresh mutation costs one Redis round trip
+plus one transaction: the user load, the old row's revocation and the new row's
+INSERT. If that fails, a second script puts the old token back, so the client
+can simply retry.
+
+The rows are revoked too so the table never vouches for a token Redis has
+retired: if Redis loses keys (eviction, failover, flush), the table fallback
+below still rejects every rotated or revoked token. Expired tokens simply drop out of Redis;
+`compact_refresh_tokens_task` later deletes their rows, and those of revoked
+tokens, in batches.
+
+Tokens issued before this store existed aren't in Redis; they are checked
+against the table once, then rotated into Redis like any other.
+"""
+import hashlib
+import logging
+from typing import Tuple
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from graphql_jwt.refresh_token.models import RefreshToken
+from socialmedia.redis_helpers import RedisConnection
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+REVOKED = "revoked"
+
+# KEYS: old live, old revoked, new live. ARGV: new token TTL (ms).
+# Returns the user id, REVOKED, or nil for a token Redis has never seen.
+ROTATE_SCRIPT = """
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    local user_id = redis.call('GET', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    redis.call('SET', KEYS[2], '1', 'PX', ttl)
+    redis.call('SET', KEYS[3], user_id, 'PX', ARGV[1])
+    return user_id
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 'revoked'
+end
+return false
+"""
+
+# Undoes ROTATE_SCRIPT. KEYS: old live, old revoked, new live. ARGV: user id.
+# The old token gets back whatever lifetime its revocation marker had left.
+RESTORE_SCRIPT = """
+redis.call('DEL', KEYS[3])
+local ttl = redis.call('PTTL', KEYS[2])
+if ttl > 0 then
+    redis.call('DEL', KEYS[2])
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ttl)
+end
+"""
+
+# KEYS: live, revoked. Returns 1 if the token was live.
+REVOKE_SCRIPT = """
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    redis.call('DEL', KEYS[1])
+    redis.call('SET', KEYS[2], '1', 'PX', ttl)
+    return 1
+end
+return 0
+"""
+
+get_redis = RedisConnection("BLACKLIST_REDIS_URL")
+_rotate = get_redis.register_script(ROTATE_SCRIPT)
+_restore = get_redis.register_script(RESTORE_SCRIPT)
+_revoke = get_redis.register_script(REVOKE_SCRIPT)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def live_key(token: str) -> str:
+    return f"refresh:live:{_digest(token)}"
+
+
+def revoked_key(token: str) -> str:
+    return f"refresh:revoked:{_digest(token)}"
+
+
+def _lifetime_ms() -> int:
+    return int(settings.JWT_REFRESH_EXPIRATION_DELTA.total_seconds() * 1000)
+
+
+class InvalidRefreshToken(Exception):
+    """Unknown, expired or already-rotated refresh token."""
+
+
+def issue_refresh_token(user) -> str:
+    """Creates a refresh token for `user`: one INSERT plus one Redis SET."""
+    refresh = RefreshToken.objects.create(user=user)
+    get_redis().set(live_key(refresh.token), user.pk, px=_lifetime_ms())
+    return refresh.token
+
+
+def rotate_refresh_token(token: str) -> Tuple[User, str]:
+    """
+    Revokes `token` and issues its replacement.
+    Returns (user with profile, new token); raises InvalidRefreshToken.
+    Nothing is revoked unless the whole rotation succeeds.
+    """
+    new_token = RefreshToken().generate_token()
+    keys = [live_key(token), revoked_key(token), live_key(new_token)]
+    result = _rotate(keys=keys, args=[_lifetime_ms()])
+    if result == REVOKED:
+        # A rotated token coming back means it leaked or the client replayed it
+        logger.warning("Revoked refresh token presented again")
+        raise InvalidRefreshToken("Refresh token revoked")
+    if result is None:
+        # The row's UPDATE rolls back with the rest if anything below fails
+        with transaction.atomic():
+            user = _load_user(_rotate_legacy_token(token))
+            RefreshToken.objects.create(user=user, token=new_token)
+        get_redis().set(live_key(new_token), user.pk, px=_lifetime_ms())
+        return user, new_token
+
+    try:
+        with transaction.atomic():
+            user = _load_user(int(result))
+            RefreshToken.objects.filter(token=token).update(revoked=timezone.now())
+            RefreshToken.objects.create(user=user, token=new_token)
+    except Exception:
+        _restore(keys=keys, args=[result])
+        raise
+    return user, new_token
+
+
+def _load_user(user_id: int) -> User:
+    try:
+        return User.objects.select_related("profile").get(pk=user_id)
+    except User.DoesNotExist:
+        raise InvalidRefreshToken("Invalid refresh token")
+
+
+def _rotate_legacy_token(token: str) -> int:
+    """
+    Tokens Redis doesn't know: one conditional UPDATE both validates and revokes the row.
+    Only pre-Redis tokens can still pass, since rotation and revocation mark the row too.
+    """
+    now = timezone.now()
+    valid = RefreshToken.objects.filter(
+        token=token,
+        revoked__isnull=True,
+        created__gt=now - settings.JWT_REFRESH_EXPIRATION_DELTA,
+    )
+    user_id = valid.values_list("user_id", flat=True).first()
+    if user_id is None or not valid.update(revoked=now):
+        raise InvalidRefreshToken("Invalid or expired refresh token")
+    return user_id
+
+
+def revoke_refresh_token(token: str) -> bool:
+    """Revokes a live token (e.g. on logout). False if it wasn't live."""
+    was_live = _revoke(keys=[live_key(token), revoked_key(token)])
+    # The row too, so the table fallback can't revive it; for pre-Redis tokens this is the revocation
+    updated = RefreshToken.objects.filter(token=token, revoked__isnull=True).update(revoked=timezone.now())
+    return bool(was_live or updated)
@@ -0,0 +1,111 @@
+# apps/users/search.py
+"""
+Profile search: ZincSearch behind a Redis cache of prefix -> ordered user ids.
+
+Only single-word prefixes up to MAX_CACHED_PREFIX chars are cached; that is
+what autocomplete sends, and it bounds how many keys a profile edit has to
+invalidate. The cached list is viewer-independent; callers filter it.
+
+Very short prefixes, and any query while Zinc is failing, are answered from
+the worker's in-process prefix index (names and usernames only, no bio).
+"""
+import logging
+import re
+from typing import Iterable, List, Optional, Set
+from django.core.cache import cache
+from .prefix_index import prefix_index
+from .zinc import get_zinc, ZincError
+
+logger = logging.getLogger(__name__)
+
+MIN_QUERY_LENGTH = 2
+SHORT_PREFIX_LENGTH = 2  # at or below this, the local index answers without Zinc
+MAX_CACHED_PREFIX = 12
+SEARCH_CACHE_TIMEOUT = 300  # seconds; edits invalidate explicitly
+SEARCH_SIZE = 20
+SEARCH_FIELDS = ["username", "first_name", "last_name", "full_name", "bio"]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def prefix_cache_key(prefix: str) -> str:
+    return f"search:profiles:{prefix}"
+
+
+def is_cacheable(normalized: str) -> bool:
+    return MIN_QUERY_LENGTH <= len(normalized) <= MAX_CACHED_PREFIX and bool(_TOKEN_RE.fullmatch(normalized))
+
+
+def tokens(*texts: Optional[str]) -> Set[str]:
+    """Lower-cased word tokens, roughly what Zinc's standard analyzer indexes."""
+    found = set()
+    for text in texts:
+        if text:
+            found.update(_TOKEN_RE.findall(text.lower()))
+    return found
+
+
+def token_prefixes(words: Iterable[str]) -> Set[str]:
+    return {
+        word[:length]
+        for word in words
+        for length in range(MIN_QUERY_LENGTH, min(len(word), MAX_CACHED_PREFIX) + 1)
+    }
+
+
+def stale_prefixes(old_tokens: Set[str], new_tokens: Set[str]) -> Set[str]:
+    """
+    Prefixes whose result set can change when a document's tokens go from old to new.
+    A prefix matching both before and after keeps the profile, so it stays cached.
+    """
+    return token_prefixes(old_tokens) ^ token_prefixes(new_tokens)
+
+
+def invalidate_prefixes(prefixes: Iterable[str]) -> None:
+    keys = [prefix_cache_key(p) for p in prefixes]
+    if keys:
+        cache.delete_many(keys)
+
+
+def _zinc_search(query: str) -> List[int]:
+    results = get_zinc().search({
+        "query": {
+            "query_string": {
+                "query": f"{query}*",  # e.g., "oma" becomes "oma*"
+                "fields": SEARCH_FIELDS,
+            }
+        },
+        "size": SEARCH_SIZE,
+        "_source": ["user_id"],
+    })
+    return [hit['_source']['user_id'] for hit in results.get('hits', {}).get('hits', [])]
+
+
+def search_profile_ids(query: str) -> List[int]:
+    """Ordered user ids matching `query`, served from the prefix cache when possible."""
+    normalized = normalize_query(query)
+    if len(normalized) < MIN_QUERY_LENGTH:
+        return []
+    prefix_index.start_background_refresh()  # no-op after the first call in this process
+    if len(normalized) <= SHORT_PREFIX_LENGTH and prefix_index.ready:
+        return prefix_index.search(normalized, SEARCH_SIZE)
+
+    try:
+        if not is_cacheable(normalized):
+            return _zinc_search(normalized)
+
+        key = prefix_cache_key(normalized)
+        user_ids = cache.get(key)
+        if user_ids is None:
+            user_ids = _zinc_search(normalized)
+            cache.set(key, user_ids, SEARCH_CACHE_TIMEOUT)
+        return list(user_ids)
+    except ZincError:
+        if not prefix_index.ready:
+            raise
+        logger.warning("ZincSearch unavailable; answering %r from the local prefix index", normalized)
+        return prefix_index.search(normalized, SEARCH_SIZE)
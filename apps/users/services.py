@@ -1,22 +1,25 @@
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from PIL import Image
 from io import BytesIO
+import hashlib
 import os
 import uuid
 from datetime import date
 from typing import Optional
 from .models import UserOTP, Profile
+from .otp import get_otp_store
 from apps.graphql_api.types import UserType,ProfileType
-from apps.users.tasks import send_mail_task
+from apps.users.tasks import process_avatar_task
+from apps.users.mailer import queue_mail
 from django.core.exceptions import PermissionDenied
 User = get_user_model()
 
@@ -43,55 +46,93 @@ def get_full_name(first_name: str, last_name: str, username: str) -> str:
         return f"{first_name} {last_name}".strip()
     return username
 
-def validate_and_process_avatar(uploaded_file) -> ContentFile:
-    """Validate and process uploaded avatar."""
-    if uploaded_file.size > 5 * 1024 * 1024:
+MAX_AVATAR_BYTES = 5 * 1024 * 1024
+MAX_AVATAR_PIXELS = 40_000_000  # refuse decompression bombs before a worker decodes them
+AVATAR_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
+# Profile field -> longest edge in px, largest first (each size is cut from the previous one)
+AVATAR_SIZES = {
+    'avatar': 400,
+    'avatar_medium': 128,
+    'avatar_small': 48,
+}
+
+def validate_avatar_upload(uploaded_file) -> None:
+    """Cheap checks that run on the request thread; only headers are parsed, no pixels decoded."""
+    if uploaded_file.size > MAX_AVATAR_BYTES:
         raise ValidationError("Avatar too large. Max 5MB.")
     
-    valid_extensions = ['.jpg', '.jpeg', '.png', '.gif']
     ext = os.path.splitext(uploaded_file.name)[1].lower()
-    if ext not in valid_extensions:
+    if ext not in AVATAR_EXTENSIONS:
         raise ValidationError("Invalid file type. Use JPG, PNG, or GIF.")
     
     try:
         image = Image.open(uploaded_file)
+        width, height = image.size
         image.verify()
     except Exception:
         raise ValidationError("Invalid image file.")
-    
+    if width * height > MAX_AVATAR_PIXELS:
+        raise ValidationError("Image dimensions too large.")
     uploaded_file.seek(0)
-    image = Image.open(uploaded_file)
-    image.thumbnail((400, 400), Image.Resampling.LANCZOS)
-    
-    if image.mode in ('RGBA', 'P'):
+
+def render_avatar_renditions(data: bytes) -> dict:
+    """
+    Decode an upload once and return {profile field: ContentFile} for every AVATAR_SIZES entry,
+    each named by the SHA-256 of its bytes.
+    JPEGs are decoded in draft mode at the smallest DCT scale that still covers
+    the largest rendition, so a phone photo never expands to full size in memory.
+    """
+    image = Image.open(BytesIO(data))
+    largest = max(AVATAR_SIZES.values())
+    image.draft('RGB', (largest, largest))  # no-op for PNG/GIF
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
         background = Image.new('RGB', image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        background.paste(image, mask=image.split()[-1])
         image = background
-    
-    output = BytesIO()
-    image.save(output, format='JPEG', quality=85)
-    output.seek(0)
-    
-    filename = f"avatar_{uuid.uuid4().hex}.jpg"
-    return ContentFile(output.read(), name=filename)
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    renditions = {}
+    for field, size in AVATAR_SIZES.items():
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=85, optimize=True)
+        data = output.getvalue()
+        # Content-addressed: identical bytes share one file, and a URL never changes meaning
+        renditions[field] = ContentFile(data, name=f"{hashlib.sha256(data).hexdigest()}.jpg")
+    return renditions
 
 # ---------- Profile Data Builders ----------
-def build_profile_data(*, profile: Profile, current_user: Optional[User] = None, request=None) -> ProfileType: #type: ignore
-    """Build complete profile data for API response."""
+def _file_url(field, request=None) -> Optional[str]:
+    if not field:
+        return None
+    if request:
+        return request.build_absolute_uri(field.url)
+    return field.url  # fallback
+
+def build_profile_data(*, profile: Profile, current_user: Optional[User] = None, request=None, loaders=None) -> ProfileType: #type: ignore
+    """
+    Build complete profile data for API response.
+    Pass request-scoped `loaders` (see apps.graphql_api.loaders) when building
+    a list so is_following comes from one batched query.
+    """
     age = calculate_age(profile.date_of_birth)
     full_name = get_full_name(profile.first_name, profile.last_name, profile.user.username)
-    followers_count = profile.followers.count()
-    following_count = profile.following.count()
-    avatar_url = None
-    if profile.avatar:
-        if request:
-            avatar_url = request.build_absolute_uri(profile.avatar.url)
-        else:
-            avatar_url = profile.avatar.url  # fallback    
+    followers_count = profile.followers_count
+    following_count = profile.following_count
+    avatar_url = _file_url(profile.avatar, request)
+    # Avatars from before the rendition pipeline only have the 400px file
+    avatar_medium_url = _file_url(profile.avatar_medium, request) or avatar_url
+    avatar_small_url = _file_url(profile.avatar_small, request) or avatar_medium_url
     # Check if current user is following this profile
     is_following = False
     if current_user and current_user != profile.user:
-        is_following = current_user.profile.following.filter(id=profile.id).exists()
+        if loaders is not None:
+            is_following = loaders.is_following.load(profile.id)
+        else:
+            is_following = current_user.profile.following.filter(id=profile.id).exists()
     
     
     return ProfileType(
@@ -107,6 +148,9 @@ def build_profile_data(*, profile: Profile, current_user: Optional[User] = None,
         created_at=profile.created_at,
         updated_at=profile.updated_at,
         avatar_url=avatar_url,
+        avatar_medium_url=avatar_medium_url,
+        avatar_small_url=avatar_small_url,
+        avatar_status=profile.avatar_status or None,
         age=age,
         full_name=full_name,
         followers_count=followers_count,
@@ -139,41 +183,24 @@ def user_create(*, username: str, email: str, password: str) -> User: # type: ig
     user.save()
     # Profile auto-created by signal
     
-    UserOTP.objects.create(user=user, purpose=UserOTP.VERIFY)
     send_verification_email(user)
     return user
 
 # ---------- OTP helpers ----------
-def _send_templated_email(user: User, subject: str, template_base: str, ctx: dict): # type: ignore
-    html_message = render_to_string(f"users/{template_base}.html", ctx)
-    plain_message = render_to_string(f"users/{template_base}.txt", ctx)
-    send_mail_task.delay(
-        subject,
-        plain_message,
-        [user.email],
-        html_message=html_message
-    )
+def _send_templated_email(user: User, template_base: str, ctx: dict): # type: ignore
+    # Rendering happens in the mail worker; only identifiers cross the broker.
+    # Queue after commit so the worker can always load the user (and never mails a rolled-back signup)
+    user_id = user.id
+    transaction.on_commit(lambda: queue_mail(template=template_base, user_id=user_id, context=ctx))
 
 def send_verification_email(user: User) -> None: # type: ignore
-    otp = UserOTP.objects.get(user=user, purpose=UserOTP.VERIFY)
-    _send_templated_email(
-        user,
-        "Verify your account",
-        "email_verify",
-        {"username": user.username, "code": otp.token}
-    )
+    # Always a fresh code; issuing replaces any outstanding one
+    code = get_otp_store().issue(user_id=user.id, purpose=UserOTP.VERIFY)
+    _send_templated_email(user, "email_verify", {"code": code})
 
 def send_password_reset_email(user: User) -> None: # type: ignore   
-    otp, _ = UserOTP.objects.get_or_create(
-        user=user, purpose=UserOTP.RESET,
-        defaults={"token": UserOTP._meta.get_field("token").default()}
-    )
-    _send_templated_email(
-        user,
-        "Password reset",
-        "password_reset",
-        {"username": user.username, "code": otp.token}
-    )
+    code = get_otp_store().get_or_issue(user_id=user.id, purpose=UserOTP.RESET)
+    _send_templated_email(user, "password_reset", {"code": code})
 
 def user_resend_verification_email(*, email: str) -> bool:
     """Resend verification email (creates new OTP)."""
@@ -185,26 +212,17 @@ def user_resend_verification_email(*, email: str) -> bool:
     if user.is_email_verified:
         raise ValidationError("Email already verified")
     
-    # Delete old OTP and create new one
-    UserOTP.objects.filter(user=user, purpose=UserOTP.VERIFY).delete()
-    UserOTP.objects.create(user=user, purpose=UserOTP.VERIFY)
+    # Replaces the old OTP with a new one
     send_verification_email(user)
     return True
 
 # ---------- Email verification ----------
 def user_verify_email(*, username: str, code: str) -> User: # type: ignore
-    try:
-        otp = UserOTP.objects.select_related("user").get(
-            user__username=username, purpose=UserOTP.VERIFY, token=code.upper()
-        )
-    except UserOTP.DoesNotExist:
+    user = User.objects.filter(username=username).first()
+    if user is None or not get_otp_store().consume(user_id=user.id, purpose=UserOTP.VERIFY, code=code.upper()):
         raise ValidationError("Invalid or expired code")
-    if otp.is_expired():
-        raise ValidationError("Code expired")
-    user = otp.user
     user.is_email_verified = True
     user.save(update_fields=["is_email_verified"])
-    otp.delete()
     return user
 
 # ---------- Password reset ----------
@@ -215,18 +233,11 @@ def user_reset_password_request(*, email: str) -> str:
     return user.username if user else ""
 
 def user_reset_password_confirm(*, username: str, code: str, new_password: str) -> bool:
-    try:
-        otp = UserOTP.objects.select_related("user").get(
-            user__username=username, purpose=UserOTP.RESET, token=code.upper()
-        )
-    except UserOTP.DoesNotExist:
+    user = User.objects.filter(username=username).first()
+    if user is None or not get_otp_store().consume(user_id=user.id, purpose=UserOTP.RESET, code=code.upper()):
         raise ValidationError("Invalid or expired code")
-    if otp.is_expired():
-        raise ValidationError("Code expired")
-    user = otp.user
     user.set_password(new_password)
     user.save(update_fields=["password"])
-    otp.delete()
     return True
 
 # ---------- Authenticated password change ----------
@@ -252,50 +263,96 @@ def profile_update(
     avatar_file=None
 ) -> Profile:
     """Update profile with optional fields."""
+    # Save only what changed so a stale instance never overwrites the follow counters
+    update_fields = ["updated_at"]
     if first_name is not None:
         profile.first_name = first_name
+        update_fields.append("first_name")
     if last_name is not None:
         profile.last_name = last_name
+        update_fields.append("last_name")
     if date_of_birth is not None:
         profile.date_of_birth = date_of_birth
+        update_fields.append("date_of_birth")
     if gender is not None:
         if gender not in dict(Profile.GENDER_CHOICES):
             raise ValidationError("Invalid gender choice")
         profile.gender = gender
+        update_fields.append("gender")
     if country is not None:
         profile.country = country
+        update_fields.append("country")
     if bio is not None:
         profile.bio = bio
+        update_fields.append("bio")
     if website is not None:
         profile.website = website
+        update_fields.append("website")
     if is_private is not None:
         profile.is_private = is_private
+        update_fields.append("is_private")
     
     if avatar_file:
-        processed_avatar = validate_and_process_avatar(avatar_file)
-        profile.avatar.save(processed_avatar.name, processed_avatar, save=False)
+        # Store the raw upload; process_avatar_task renders every size off the request thread
+        validate_avatar_upload(avatar_file)
+        ext = os.path.splitext(avatar_file.name)[1].lower()
+        profile.avatar_upload.save(f"upload_{uuid.uuid4().hex}{ext}", avatar_file, save=False)
+        profile.avatar_status = Profile.AVATAR_PENDING
+        update_fields += ["avatar_upload", "avatar_status"]
     
-    profile.save()
+    profile.save(update_fields=update_fields)
+    if avatar_file:
+        upload_name = profile.avatar_upload.name
+        transaction.on_commit(lambda: process_avatar_task.delay(profile.id, upload_name))
     return profile
 
 # ---------- Follow/Unfollow ----------
+Follow = Profile.following.through
+
+def _adjust_follow_counters(*, follower_id: int, followee_id: int, delta: int) -> None:
+    """
+    Atomically shift the denormalized counters for one follow edge.
+    Rows are updated in primary-key order so two profiles following each other
+    concurrently can't deadlock; F() keeps a follow storm on a hot account from
+    losing increments.
+    """
+    edges = sorted([(follower_id, "following_count"), (followee_id, "followers_count")])
+    for profile_id, field in edges:
+        value = F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+        Profile.objects.filter(pk=profile_id).update(**{field: value})
+
+def _add_follow(follower_id: int, followee_id: int) -> bool:
+    _, created = Follow.objects.get_or_create(from_profile_id=follower_id, to_profile_id=followee_id)
+    if created:
+        _adjust_follow_counters(follower_id=follower_id, followee_id=followee_id, delta=1)
+    return created
+
+def _remove_follow(follower_id: int, followee_id: int) -> bool:
+    deleted, _ = Follow.objects.filter(from_profile_id=follower_id, to_profile_id=followee_id).delete()
+    if deleted:
+        _adjust_follow_counters(follower_id=follower_id, followee_id=followee_id, delta=-1)
+    return bool(deleted)
+
+@transaction.atomic
 def profile_follow(*, follower_profile: Profile, followee_profile: Profile) -> bool:
     if follower_profile.user == followee_profile.user:
         raise ValidationError("Cannot follow yourself")
-    follower_profile.following.add(followee_profile)
+    _add_follow(follower_profile.id, followee_profile.id)
     return True
 
+@transaction.atomic
 def profile_unfollow(*, follower_profile: Profile, followee_profile: Profile) -> bool:
-    follower_profile.following.remove(followee_profile)
+    _remove_follow(follower_profile.id, followee_profile.id)
     return True
 
 # ---------- Block/Unblock ----------
+@transaction.atomic
 def profile_block(*, blocker_profile: Profile, blocked_profile: Profile) -> bool:
     if blocker_profile.user == blocked_profile.user:
         raise ValidationError("Cannot block yourself")
     blocker_profile.blocked_users.add(blocked_profile)
-    blocker_profile.following.remove(blocked_profile)
-    blocked_profile.following.remove(blocker_profile)
+    _remove_follow(blocker_profile.id, blocked_profile.id)
+    _remove_follow(blocked_profile.id, blocker_profile.id)
     return True
 
 def profile_unblock(*, blocker_profile: Profile, blocked_profile: Profile) -> bool:
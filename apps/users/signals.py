@@ -1,55 +1,123 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from .models import Profile
-from requests.auth import HTTPBasicAuth
-import requests
+from .auth import user_cache_key
+from .indexing import queue_profile_index, queue_profile_delete
+from .search import tokens, stale_prefixes
+from .prefix_index import prefix_index
 
 User = get_user_model()
 
+# Fields that end up in the ZincSearch document; saves touching nothing else skip reindexing
+PROFILE_INDEXED_FIELDS = {"first_name", "last_name", "bio"}
+USER_INDEXED_FIELDS = {"username"}
+# Subset the in-process prefix index covers
+PROFILE_NAME_FIELDS = ("first_name", "last_name")
 
-ZINC_HOST = "http://localhost:4080"
-ZINC_USER = "admin"
-ZINC_PASSWORD = "Admin@123"
-INDEX_NAME = "profiles"
-AUTH = HTTPBasicAuth(ZINC_USER, ZINC_PASSWORD)
-HEADERS = {"Content-Type": "application/json"}
 
+def _touches_index(update_fields, indexed_fields) -> bool:
+    return update_fields is None or bool(indexed_fields & set(update_fields))
 
 
+def _snapshot(instance, fields) -> dict:
+    # Read __dict__ directly so deferred fields never trigger a query
+    return {field: instance.__dict__.get(field) for field in fields}
 
 
+def _tokens(values: dict, fields) -> set:
+    return tokens(*(values.get(field) for field in fields))
+
+
+def _name_terms(username, names: dict) -> set:
+    # The prefix index holds one entry per distinct term across all three fields, so
+    # both sides of a replace() must cover all three: a term dropped from one field
+    # may still be provided by another
+    return tokens(username, *(names.get(field) for field in PROFILE_NAME_FIELDS))
+
+
+def _profile_username(profile):
+    if Profile.user.is_cached(profile):
+        return profile.user.username
+    return User.objects.filter(pk=profile.user_id).values_list("username", flat=True).first()
+
+
+def _replace_prefix_terms(user_id, old_terms, new_terms) -> None:
+    # Like the Zinc queue, only once the transaction commits: a rollback must not leave phantom terms
+    transaction.on_commit(lambda: prefix_index.replace(user_id, old_terms, new_terms))
+
+
+@receiver(post_init, sender=Profile)
+def snapshot_profile_fields(sender, instance, **kwargs):
+    """Remembers the searchable fields as loaded, to work out what an edit changes in search."""
+    instance._indexed_values = _snapshot(instance, PROFILE_INDEXED_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def snapshot_username(sender, instance, **kwargs):
+    instance._indexed_values = _snapshot(instance, USER_INDEXED_FIELDS)
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drops the auth cache entry so the next request reloads the user."""
+    # After commit: deleting earlier lets a concurrent request re-cache the old row
+    key = user_cache_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
         
         
 @receiver(post_save, sender=Profile)
-def update_profile_document(sender, instance, **kwargs):
-    """Creates or updates a profile document in ZincSearch."""
-    doc = {
-        "user_id": instance.user.id,
-        "username": instance.user.username,
-        "first_name": instance.first_name,
-        "last_name": instance.last_name,
-        "full_name": instance.full_name,
-        "bio": instance.bio,
-    }
-    # ZincSearch uses PUT to create/update a document with a specific ID
-    url = f"{ZINC_HOST}/api/{INDEX_NAME}/_doc/{instance.id}"
-    requests.put(url, auth=AUTH, headers=HEADERS, json=doc)
+def update_profile_document(sender, instance, created, update_fields=None, **kwargs):
+    """Queues the profile for (re)indexing in ZincSearch once the transaction commits."""
+    if not _touches_index(update_fields, PROFILE_INDEXED_FIELDS):
+        return
+    old_values = {} if created else instance._indexed_values
+    new_values = _snapshot(instance, PROFILE_INDEXED_FIELDS)
+    old_tokens = _tokens(old_values, PROFILE_INDEXED_FIELDS)
+    new_tokens = _tokens(new_values, PROFILE_INDEXED_FIELDS)
+    names_changed = created or _tokens(old_values, PROFILE_NAME_FIELDS) != _tokens(new_values, PROFILE_NAME_FIELDS)
+    username = _profile_username(instance) if names_changed else None
+    if created:
+        # A brand-new document also starts matching its username's prefixes
+        new_tokens |= tokens(username)
+
+    queue_profile_index(instance.id, stale_prefixes(old_tokens, new_tokens))
+    if names_changed:
+        old_names = set() if created else _name_terms(username, old_values)
+        _replace_prefix_terms(instance.user_id, old_names, _name_terms(username, new_values))
+    instance._indexed_values = new_values
 
 @receiver(post_delete, sender=Profile)
 def delete_profile_document(sender, instance, **kwargs):
-    """Deletes a profile document from ZincSearch."""
-    url = f"{ZINC_HOST}/api/{INDEX_NAME}/_doc/{instance.id}"
-    requests.delete(url, auth=AUTH)
+    """Queues removal of the profile document from ZincSearch."""
+    old_tokens = _tokens(instance._indexed_values, PROFILE_INDEXED_FIELDS)
+    # Cached ids of deleted profiles are dropped by the Postgres fetch anyway; this just frees the slots
+    queue_profile_delete(instance.id, stale_prefixes(old_tokens, set()))
+    _replace_prefix_terms(instance.user_id, _name_terms(_profile_username(instance), instance._indexed_values), set())
 
-User = get_user_model()
 @receiver(post_save, sender=User)
-def update_user_in_profile_document(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        update_profile_document(sender=Profile, instance=instance.profile, **kwargs)
+def update_user_in_profile_document(sender, instance, created, update_fields=None, **kwargs):
+    # New users are indexed through their freshly created Profile; logins only touch last_login
+    if created or not _touches_index(update_fields, USER_INDEXED_FIELDS):
+        return
+    old_tokens = _tokens(instance._indexed_values, USER_INDEXED_FIELDS)
+    new_values = _snapshot(instance, USER_INDEXED_FIELDS)
+    new_tokens = _tokens(new_values, USER_INDEXED_FIELDS)
+    profile = Profile.objects.filter(user=instance).values("id", *PROFILE_NAME_FIELDS).first()
+    if profile is not None:
+        queue_profile_index(profile["id"], stale_prefixes(old_tokens, new_tokens))
+        _replace_prefix_terms(
+            instance.pk,
+            _name_terms(instance._indexed_values.get("username"), profile),
+            _name_terms(new_values.get("username"), profile),
+        )
+    instance._indexed_values = new_values
@@ -1,6 +1,14 @@
+import logging
+import os
+import time
 from celery import shared_task
+from celery.signals import worker_process_init
 from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def send_mail_task(self, subject, plain_message, recipient_list, html_message=None):
@@ -14,4 +22,200 @@ def send_mail_task(self, subject, plain_message, recipient_list, html_message=No
             fail_silently=False,
         )
     except Exception as exc:
-        raise self.retry(exc=exc)
\ No newline at end of file
+        raise self.retry(exc=exc)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_templated_mail_task(self, message):
+    """Renders and sends one queued message (see apps.users.mailer) on its own connection."""
+    from . import mailer
+
+    try:
+        failed, _ = mailer.send_batch([message])
+    except Exception as exc:
+        raise self.retry(exc=exc)
+    if failed:
+        raise self.retry()
+
+@worker_process_init.connect
+def precompile_email_templates(**kwargs):
+    from .mailer import precompile_templates
+    precompile_templates()
+
+@shared_task(bind=True, max_retries=10, default_retry_delay=30)
+def send_mail_batch_task(self):
+    """Drains the outbox in groups, one SMTP session per group (see apps.users.mailer)."""
+    from . import mailer
+
+    mailer.drain_schedule.clear()
+    sent = failed = skipped = 0
+    started = time.monotonic()
+    try:
+        for _ in range(mailer.MAX_BATCHES_PER_RUN):
+            batch = mailer.take_batch()
+            if not batch:
+                break
+            try:
+                failures, dropped = mailer.send_batch(batch)
+            except Exception as exc:
+                # Couldn't even open a session: nothing in this group went out
+                mailer.requeue(batch)
+                raise self.retry(exc=exc)
+            # Each failed message retries on its own schedule
+            for message in failures:
+                send_templated_mail_task.delay(message)
+            sent += len(batch) - len(failures) - len(dropped)
+            failed += len(failures)
+            skipped += len(dropped)
+        else:
+            # Still backed up; continue in a fresh task so other queued work gets a turn
+            send_mail_batch_task.delay()
+    finally:
+        mailer.record_stats(sent=sent, failed=failed, skipped=skipped, seconds=time.monotonic() - started)
+    return sent
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=10)
+def flush_profile_index_task(self, batch=None, stale_prefixes=None):
+    """Flushes queued profile index changes to ZincSearch as one `_bulk` request."""
+    from .indexing import take_pending, send_bulk, dead_letter
+    from .search import invalidate_prefixes
+    from .zinc import ZincError
+
+    if batch is None:
+        batch, stale_prefixes = take_pending()
+    if not batch:
+        return 0
+    try:
+        send_bulk(batch)
+    except Exception as exc:
+        # The batch was already claimed from Redis, so any failure here (Zinc, or
+        # Postgres while building documents) must retry or dead-letter it, never drop it
+        if not isinstance(exc, ZincError):
+            logger.exception("Profile index flush failed for %s entries", len(batch))
+        if self.request.retries >= self.max_retries:
+            dead_letter(batch, stale_prefixes, exc)
+            return 0
+        # Retry this exact batch; newer changes keep queueing behind it
+        raise self.retry(exc=exc, kwargs={"batch": batch, "stale_prefixes": stale_prefixes})
+    # Only now does Zinc answer with the new data, so drop cached prefixes after the write
+    invalidate_prefixes(stale_prefixes or [])
+    return len(batch)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def process_avatar_task(self, profile_id, upload_name):
+    """Renders every avatar size from a stored raw upload and swaps them onto the profile."""
+    from .models import Profile
+    from .services import render_avatar_renditions
+
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or profile.avatar_upload.name != upload_name:
+        return  # profile gone, or a newer upload superseded this one and has its own task
+    try:
+        with profile.avatar_upload.open('rb') as upload:
+            data = upload.read()
+    except OSError as exc:
+        raise self.retry(exc=exc)
+
+    try:
+        renditions = render_avatar_renditions(data)
+    except Exception:
+        logger.exception("Could not render avatar %s for profile %s", upload_name, profile_id)
+        Profile.objects.filter(pk=profile_id, avatar_upload=upload_name).update(
+            avatar_status=Profile.AVATAR_FAILED
+        )
+        return
+
+    storage = profile.avatar.storage
+    saved = {}
+    for field, content in renditions.items():
+        name = profile._meta.get_field(field).generate_filename(profile, content.name)
+        # Names are content hashes, so an existing file already holds these exact bytes.
+        # Reusing it bumps its mtime so the sweeper's grace period covers it until the UPDATE lands.
+        if storage.exists(name) and _refresh_mtime(storage, name):
+            saved[field] = name
+        else:
+            saved[field] = storage.save(name, content)
+    # Conditional on the upload still being current, so a slow task can't
+    # overwrite the renditions of a newer upload
+    swapped = Profile.objects.filter(pk=profile_id, avatar_upload=upload_name).update(
+        **saved,
+        avatar_upload=None,
+        avatar_status=Profile.AVATAR_READY,
+        updated_at=timezone.now(),
+    )
+    if swapped:
+        profile.avatar_upload.storage.delete(upload_name)
+    # Otherwise the renditions may be shared with other profiles; sweep_avatar_files_task
+    # removes them once nothing references them
+
+
+def _refresh_mtime(storage, name) -> bool:
+    """False if the storage can't touch files (or the file just vanished); the caller re-saves."""
+    try:
+        os.utime(storage.path(name))
+    except (NotImplementedError, FileNotFoundError):
+        return False
+    return True
+
+
+# (field whose storage holds the files, directory)
+AVATAR_DIRECTORIES = (('avatar', 'avatars'), ('avatar_upload', 'avatars/uploads'))
+AVATAR_SWEEP_GRACE = timedelta(hours=1)  # leaves files from in-flight uploads and tasks alone
+
+@shared_task
+def sweep_avatar_files_task():
+    """Deletes avatar renditions and abandoned raw uploads that no Profile references."""
+    from django.db.models import Q
+    from .models import Profile
+    from .services import AVATAR_SIZES
+
+    fields = [*AVATAR_SIZES, 'avatar_upload']
+    referenced = set()
+    for row in Profile.objects.values_list(*fields).iterator(chunk_size=5000):
+        referenced.update(name for name in row if name)
+
+    cutoff = timezone.now() - AVATAR_SWEEP_GRACE
+    deleted = 0
+    for storage_field, directory in AVATAR_DIRECTORIES:
+        storage = Profile._meta.get_field(storage_field).storage
+        try:
+            _, files = storage.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for filename in files:
+            name = f"{directory}/{filename}"
+            if name in referenced or storage.get_modified_time(name) > cutoff:
+                continue
+            # A dedupe hit may have re-adopted this file since the snapshot above
+            if Profile.objects.filter(Q(**{f: name for f in fields}, _connector=Q.OR)).exists():
+                continue
+            storage.delete(name)
+            deleted += 1
+    logger.info("Avatar sweep removed %s unreferenced files", deleted)
+    return deleted
+
+@shared_task
+def purge_expired_otps_task():
+    """Deletes expired UserOTP rows, including any left from before the Redis store."""
+    from .otp import DatabaseOTPStore
+
+    deleted = DatabaseOTPStore().purge_expired()
+    logger.info("OTP purge removed %s expired codes", deleted)
+    return deleted
+
+@shared_task
+def compact_refresh_tokens_task(batch_size=1000):
+    """Deletes expired and revoked graphql_jwt RefreshToken rows in primary-key batches."""
+    from django.db.models import Q
+    from graphql_jwt.refresh_token.models import RefreshToken
+
+    expired_before = timezone.now() - settings.JWT_REFRESH_EXPIRATION_DELTA
+    # Rotation and revocation mark the row as well as Redis, so the table alone says what's dead
+    dead = RefreshToken.objects.filter(Q(revoked__isnull=False) | Q(created__lte=expired_before))
+    deleted = 0
+    while True:
+        pks = list(dead.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        deleted += RefreshToken.objects.filter(pk__in=pks).delete()[0]
+    logger.info("Refresh token compaction removed %s rows", deleted)
+    return deleted
@@ -1,3 +1,283 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, override_settings
+from graphql_jwt.refresh_token.models import RefreshToken
+
+from . import refresh_tokens
+from .jwt_cache import PayloadCache
+from .models import Profile, UserOTP
+from .otp import OTP_TTL, DatabaseOTPStore
+from .prefix_index import PrefixIndex, prefix_index
+from .refresh_tokens import (
+    InvalidRefreshToken, issue_refresh_token, live_key, revoked_key,
+    revoke_refresh_token, rotate_refresh_token,
+)
+
+User = get_user_model()
+
+
+class PayloadCacheTests(SimpleTestCase):
+    NOW = 1_700_000_000
+
+    def setUp(self):
+        clock = mock.patch("apps.users.jwt_cache.time.time", return_value=self.NOW)
+        self.clock = clock.start()
+        self.addCleanup(clock.stop)
+        self.cache = PayloadCache(maxsize=2)
+
+    def test_hit_and_miss(self):
+        payload = {"username": "alice", "exp": self.NOW + 60}
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", payload)
+        self.assertEqual(self.cache.get("a"), payload)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_entry_expires_with_the_token(self):
+        self.cache.put("a", {"exp": self.NOW + 60})
+        self.clock.return_value = self.NOW + 59
+        self.assertIsNotNone(self.cache.get("a"))
+        self.clock.return_value = self.NOW + 60
+        self.assertIsNone(self.cache.get("a"))
+        stats = self.cache.stats()
+        self.assertEqual(stats["expirations"], 1)
+        self.assertEqual(stats["size"], 0)
+
+    def test_payload_without_exp_is_not_cached(self):
+        self.cache.put("a", {"username": "alice"})
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put("a", {"exp": self.NOW + 60})
+        self.cache.put("b", {"exp": self.NOW + 60})
+        self.cache.get("a")  # b is now the oldest
+        self.cache.put("c", {"exp": self.NOW + 60})
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["size"], 2)
+
+
+class PrefixIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = {}
+        for username, first_name, last_name in [
+            ("jsmith", "John", "Smith"),
+            ("asmith", "Anna", "Smith"),
+            ("ann", "Ann", "Jones"),
+        ]:
+            user = User.objects.create_user(username=username, email=f"{username}@example.com", password="pw")
+            user.profile.first_name, user.profile.last_name = first_name, last_name
+            user.profile.save()
+            cls.ids[username] = user.id
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.build()
+
+    def test_prefix_matches_any_name_word(self):
+        self.assertEqual(set(self.index.search("smi", limit=10)), {self.ids["jsmith"], self.ids["asmith"]})
+        self.assertEqual(self.index.search("jsm", limit=10), [self.ids["jsmith"]])
+
+    def test_every_query_word_must_match(self):
+        self.assertEqual(self.index.search("jo smith", limit=10), [self.ids["jsmith"]])
+        self.assertEqual(self.index.search("jones smith", limit=10), [])
+
+    def test_exact_word_comes_first(self):
+        self.assertEqual(self.index.search("ann", limit=10), [self.ids["ann"], self.ids["asmith"]])
+        self.assertEqual(self.index.search("ann", limit=1), [self.ids["ann"]])
+
+    def test_user_matching_several_words_is_listed_once(self):
+        # "ann" is both the username and the first name of the same user
+        self.assertEqual(self.index.search("an", limit=10).count(self.ids["ann"]), 1)
+
+    def test_replace_moves_a_users_terms(self):
+        user_id = self.ids["jsmith"]
+        self.index.replace(user_id, {"jsmith", "john", "smith"}, {"jsmith", "john", "doe"})
+        self.assertEqual(self.index.search("smith", limit=10), [self.ids["asmith"]])
+        self.assertEqual(self.index.search("doe", limit=10), [user_id])
+        self.assertEqual(self.index.search("jsm", limit=10), [user_id])
+
+    def test_replace_is_idempotent(self):
+        user_id = self.ids["ann"]
+        entries = self.index.stats()["entries"]
+        self.index.replace(user_id, set(), {"jones"})
+        self.index.replace(user_id, {"nobody"}, set())
+        self.assertEqual(self.index.stats()["entries"], entries)
+
+    def test_replace_before_first_build_is_ignored(self):
+        index = PrefixIndex()
+        index.replace(self.ids["ann"], set(), {"zed"})
+        self.assertFalse(index.ready)
+        self.assertEqual(index.stats()["entries"], 0)
+        self.assertEqual(index.search("zed", limit=10), [])
+
+
+class PrefixIndexSignalTests(TestCase):
+    """The profile and user signals keep the process-wide index in step with edits."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="john", email="john@example.com", password="pw")
+        self.user.profile.first_name = "John"
+        self.user.profile.save()
+        prefix_index.build()
+
+    def save(self, instance):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    def test_name_change_keeps_terms_the_username_still_provides(self):
+        profile = self.user.profile
+        profile.first_name = "Jon"
+        self.save(profile)
+        self.assertEqual(prefix_index.search("joh", limit=10), [self.user.id])
+        self.assertEqual(prefix_index.search("jon", limit=10), [self.user.id])
+
+    def test_username_change_keeps_terms_a_name_still_provides(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.username = "jdoe"
+        self.save(user)
+        self.assertEqual(prefix_index.search("joh", limit=10), [self.user.id])
+        self.assertEqual(prefix_index.search("jdo", limit=10), [self.user.id])
+
+    def test_deleting_the_profile_drops_every_term(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.get(user=self.user).delete()
+        self.assertEqual(prefix_index.search("joh", limit=10), [])
+
+
+# A Redis db of its own, flushed around every test
+TEST_BLACKLIST_REDIS_URL = settings.BLACKLIST_REDIS_URL.rsplit("/", 1)[0] + "/15"
+
+
+@override_settings(BLACKLIST_REDIS_URL=TEST_BLACKLIST_REDIS_URL)
+class RefreshTokenRotationTests(TestCase):
+    def setUp(self):
+        refresh_tokens.get_redis.reset()  # reconnect to the test db
+        self.addCleanup(refresh_tokens.get_redis.reset)
+        self.redis = refresh_tokens.get_redis()
+        self.redis.flushdb()
+        self.addCleanup(self.redis.flushdb)
+        self.user = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+
+    def test_rotation_issues_a_working_replacement(self):
+        token = issue_refresh_token(self.user)
+        user, new_token = rotate_refresh_token(token)
+        self.assertEqual(user, self.user)
+        self.assertNotEqual(new_token, token)
+        self.assertTrue(RefreshToken.objects.filter(token=new_token, user=self.user).exists())
+        user, _ = rotate_refresh_token(new_token)
+        self.assertEqual(user, self.user)
+
+    def test_replayed_token_is_rejected(self):
+        token = issue_refresh_token(self.user)
+        rotate_refresh_token(token)
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token(token)
+        self.assertTrue(self.redis.exists(revoked_key(token)))
+
+    def test_rotated_token_stays_rejected_when_redis_loses_it(self):
+        token = issue_refresh_token(self.user)
+        _, new_token = rotate_refresh_token(token)
+        self.redis.flushdb()
+        # Only the table is left to ask, and it saw the rotation too
+        self.assertTrue(RefreshToken.objects.get(token=token).revoked)
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token(token)
+        user, _ = rotate_refresh_token(new_token)
+        self.assertEqual(user, self.user)
+
+    def test_unknown_token_is_rejected(self):
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token("not-a-token")
+
+    def test_redis_keys_never_contain_the_token(self):
+        token = issue_refresh_token(self.user)
+        _, new_token = rotate_refresh_token(token)
+        keys = self.redis.keys("*")
+        self.assertIn(live_key(new_token), keys)
+        self.assertFalse(any(token in key or new_token in key for key in keys))
+
+    def test_failed_insert_keeps_the_old_token(self):
+        token = issue_refresh_token(self.user)
+        with mock.patch.object(RefreshToken.objects, "create", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                rotate_refresh_token(token)
+        self.assertFalse(self.redis.exists(revoked_key(token)))
+        self.assertIsNone(RefreshToken.objects.get(token=token).revoked)
+        self.assertEqual(self.redis.keys("refresh:live:*"), [live_key(token)])
+        # The client retries with the token it still holds
+        user, _ = rotate_refresh_token(token)
+        self.assertEqual(user, self.user)
+
+    def test_token_of_deleted_user_is_rejected(self):
+        token = issue_refresh_token(self.user)
+        self.user.delete()
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token(token)
+
+    def test_revoked_token_is_rejected(self):
+        token = issue_refresh_token(self.user)
+        self.assertTrue(revoke_refresh_token(token))
+        self.assertFalse(revoke_refresh_token(token))
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token(token)
+        self.redis.flushdb()
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token(token)
+
+    def test_legacy_token_rotates_once(self):
+        # Issued before the Redis store: only the table knows it
+        legacy = RefreshToken.objects.create(user=self.user)
+        user, new_token = rotate_refresh_token(legacy.token)
+        self.assertEqual(user, self.user)
+        legacy.refresh_from_db()
+        self.assertIsNotNone(legacy.revoked)
+        self.assertTrue(self.redis.exists(live_key(new_token)))
+        with self.assertRaises(InvalidRefreshToken):
+            rotate_refresh_token(legacy.token)
+
+    def test_failed_legacy_rotation_rolls_back(self):
+        legacy = RefreshToken.objects.create(user=self.user)
+        with mock.patch.object(RefreshToken.objects, "create", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                rotate_refresh_token(legacy.token)
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.revoked)
+        self.assertEqual(self.redis.keys("refresh:live:*"), [])
+
+
+class DatabaseOTPStoreTests(TestCase):
+    def setUp(self):
+        self.store = DatabaseOTPStore()
+        self.user = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+
+    def expire(self):
+        UserOTP.objects.update(created=timezone.now() - timedelta(seconds=OTP_TTL + 1))
+
+    def test_live_code_is_reused(self):
+        code = self.store.get_or_issue(user_id=self.user.id, purpose=UserOTP.VERIFY)
+        self.assertEqual(self.store.get_or_issue(user_id=self.user.id, purpose=UserOTP.VERIFY), code)
+
+    def test_expired_code_is_replaced(self):
+        self.store.get_or_issue(user_id=self.user.id, purpose=UserOTP.VERIFY)
+        self.expire()
+        code = self.store.get_or_issue(user_id=self.user.id, purpose=UserOTP.VERIFY)
+        self.assertTrue(self.store.consume(user_id=self.user.id, purpose=UserOTP.VERIFY, code=code))
+
+    def test_purge_removes_only_expired_rows(self):
+        self.store.issue(user_id=self.user.id, purpose=UserOTP.VERIFY)
+        self.expire()
+        self.store.issue(user_id=self.user.id, purpose=UserOTP.RESET)
+        self.assertEqual(self.store.purge_expired(), 1)
+        self.assertEqual(list(UserOTP.objects.values_list("purpose", flat=True)), [UserOTP.RESET])
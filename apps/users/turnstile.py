@@ -0,0 +1,164 @@
+# apps/users/turnstile.py
+"""
+Cloudflare Turnstile verification.
+
+One pooled keep-alive session per worker process with a strict timeout, and a
+short-lived cache of Cloudflare's answer per token, so a retry of the same
+token is answered locally instead of calling out again.
+
+A token still buys exactly one registration: a successful verify() also
+claims the token atomically (cache.add), and every later verify() of it fails
+until the claim is released. Callers release only when the action the CAPTCHA
+guarded did not happen (e.g. user_create rejected the username), which is
+what makes the cached answer useful for retries without allowing replay.
+
+TURNSTILE_VERIFIER picks the implementation; point it at StubVerifier to
+load-test registration offline.
+"""
+import hashlib
+import logging
+import threading
+from typing import Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SITEVERIFY_URL = 'https://challenges.cloudflare.com/turnstile/v0/siteverify'
+
+
+def result_cache_key(token: str) -> str:
+    # Tokens are up to 2KB; hash them so keys stay small
+    return f"turnstile:{hashlib.sha256(token.encode()).hexdigest()}"
+
+
+def claim_cache_key(token: str) -> str:
+    return f"{result_cache_key(token)}:claimed"
+
+
+class TurnstileVerifier:
+    def __init__(self, *, secret_key: str, timeout: tuple, pool_size: int, cache_timeout: int):
+        self.secret_key = secret_key
+        self.timeout = timeout
+        self.cache_timeout = cache_timeout
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self._pool_size = pool_size
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def _payload(self, token: str, remote_ip: Optional[str]) -> dict:
+        data = {'secret': self.secret_key, 'response': token}
+        if remote_ip:
+            data['remoteip'] = remote_ip
+        return data
+
+    def verify(self, token: str, remote_ip: Optional[str] = None) -> bool:
+        """
+        True for a valid, unclaimed token, which is now claimed (see release()).
+        Network failures count as invalid and are not cached.
+        """
+        if not token:
+            return False
+        return self._check(token, remote_ip) and cache.add(claim_cache_key(token), 1, self.cache_timeout)
+
+    def release(self, token: str) -> None:
+        """Un-claims a verified token whose guarded action didn't go through, so a retry can reuse it."""
+        cache.delete(claim_cache_key(token))
+
+    def _check(self, token: str, remote_ip: Optional[str]) -> bool:
+        key = result_cache_key(token)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            response = self.session.post(
+                SITEVERIFY_URL, data=self._payload(token, remote_ip), timeout=self.timeout
+            )
+            response.raise_for_status()
+            success = bool(response.json().get('success', False))
+        except (requests.exceptions.RequestException, ValueError):
+            # If Cloudflare is down or the request fails, treat it as a failed validation
+            logger.warning("Turnstile verification request failed", exc_info=True)
+            return False
+        cache.set(key, success, self.cache_timeout)
+        return success
+
+    async def averify(self, token: str, remote_ip: Optional[str] = None) -> bool:
+        """verify() for async callers; never blocks the event loop."""
+        if not token:
+            return False
+        return await self._acheck(token, remote_ip) and await cache.aadd(
+            claim_cache_key(token), 1, self.cache_timeout
+        )
+
+    async def arelease(self, token: str) -> None:
+        await cache.adelete(claim_cache_key(token))
+
+    async def _acheck(self, token: str, remote_ip: Optional[str]) -> bool:
+        key = result_cache_key(token)
+        cached = await cache.aget(key)
+        if cached is not None:
+            return cached
+
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_keepalive_connections=self._pool_size),
+            )
+        try:
+            response = await self._async_client.post(SITEVERIFY_URL, data=self._payload(token, remote_ip))
+            response.raise_for_status()
+            success = bool(response.json().get('success', False))
+        except (httpx.HTTPError, ValueError):
+            logger.warning("Turnstile verification request failed", exc_info=True)
+            return False
+        await cache.aset(key, success, self.cache_timeout)
+        return success
+
+
+class StubVerifier:
+    """
+    Offline stand-in: accepts any non-empty token except ones starting with
+    "fail", without touching the network. Never use in production.
+    """
+
+    def __init__(self, **kwargs):
+        logger.warning("Turnstile verification is stubbed out; CAPTCHA is NOT enforced")
+
+    def verify(self, token: str, remote_ip: Optional[str] = None) -> bool:
+        return bool(token) and not token.startswith('fail')
+
+    async def averify(self, token: str, remote_ip: Optional[str] = None) -> bool:
+        return self.verify(token, remote_ip)
+
+    def release(self, token: str) -> None:
+        pass
+
+    async def arelease(self, token: str) -> None:
+        pass
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    """Returns this process's verifier, built lazily so forked workers get their own pool."""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = import_string(settings.TURNSTILE_VERIFIER)(
+                    secret_key=settings.TURNSTILE_SECRET_KEY,
+                    timeout=(settings.TURNSTILE_CONNECT_TIMEOUT, settings.TURNSTILE_READ_TIMEOUT),
+                    pool_size=settings.TURNSTILE_POOL_SIZE,
+                    cache_timeout=settings.TURNSTILE_CACHE_TIMEOUT,
+                )
+    return _verifier
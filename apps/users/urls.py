@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import AvatarUploadView
+from .views import AvatarUploadView, StatsView
 
 urlpatterns = [
     path('avatar/', AvatarUploadView.as_view(), name='avatar-upload'),
+    path('stats/', StatsView.as_view(), name='stats'),
 ]
\ No newline at end of file
@@ -1,26 +1,18 @@
 # apps/users/utils.py
-import requests
-from django.conf import settings
+from typing import Optional
+from .turnstile import get_verifier
 
-def verify_turnstile_token(token: str) -> bool:
+def verify_turnstile_token(token: str, remote_ip: Optional[str] = None) -> bool:
     """
-    Verifies a Cloudflare Turnstile token.
-    Returns True for a valid token, False otherwise.
+    Verifies a Cloudflare Turnstile token and claims it for one use.
+    Returns True for a valid, unused token, False otherwise.
     """
-    if not token:
-        return False
+    return get_verifier().verify(token, remote_ip)
 
-    try:
-        response = requests.post(
-            'https://challenges.cloudflare.com/turnstile/v0/siteverify',
-            data={
-                'secret': settings.TURNSTILE_SECRET_KEY,
-                'response': token,
-            }
-        )
-        response.raise_for_status()
-        result = response.json()
-        return result.get('success', False)
-    except requests.exceptions.RequestException:
-        # If Cloudflare is down or the request fails, treat it as a failed validation
-        return False
\ No newline at end of file
+def release_turnstile_token(token: str) -> None:
+    """Gives a claimed token back when the action it guarded failed, so the client can retry."""
+    get_verifier().release(token)
+
+async def averify_turnstile_token(token: str, remote_ip: Optional[str] = None) -> bool:
+    """Async variant of verify_turnstile_token."""
+    return await get_verifier().averify(token, remote_ip)
@@ -1,10 +1,18 @@
+import os
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from django.core.exceptions import ValidationError
-from .services import profile_update, validate_and_process_avatar
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+from .services import profile_update
 from .auth import GraphQLJWTAuthentication  # ← Import custom auth
+from .jwt_cache import get_payload_cache
+from .mailer import mail_stats
+from .prefix_index import prefix_index
 
 class AvatarUploadView(APIView):
     authentication_classes = [GraphQLJWTAuthentication]  # ← Use custom auth
@@ -27,17 +35,47 @@ class AvatarUploadView(APIView):
             )
         
         try:
-            processed_avatar = validate_and_process_avatar(avatar_file)
+            # Validates and stores the raw file; the renditions are produced by a Celery worker
             profile = profile_update(
                 profile=request.user.profile,
-                avatar_file=processed_avatar
+                avatar_file=avatar_file
             )
             return Response({
+                "avatar_status": profile.avatar_status,
                 "avatar_url": profile.avatar.url if profile.avatar else None
-            }, status=status.HTTP_200_OK)
+            }, status=status.HTTP_202_ACCEPTED)
             
         except ValidationError as e:
             return Response(
                 {"error": str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+class StatsView(APIView):
+    """
+    Staff-only counters for the in-process caches. Each worker process has its
+    own JWT payload cache and prefix index, so the numbers describe the worker
+    that answered; `pid` says which one.
+    """
+    authentication_classes = [GraphQLJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "pid": os.getpid(),
+            "jwt_payload_cache": get_payload_cache().stats(),
+            "prefix_index": prefix_index.stats(),
+            "mail": mail_stats(),
+        })
+
+AVATAR_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+def serve_avatar(request, path):
+    """
+    Development-only server for avatar renditions, with the far-future immutable
+    caching they are named for (content hashes, so a URL's bytes never change).
+    In production the front server serves /media/avatars/ and sets these headers.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    patch_cache_control(response, public=True, max_age=AVATAR_CACHE_MAX_AGE, immutable=True)
+    return response
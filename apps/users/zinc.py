@@ -0,0 +1,216 @@
+# apps/users/zinc.py
+"""
+Process-wide ZincSearch client.
+
+One pooled, keep-alive requests.Session per worker process, strict timeouts,
+a small retry allowance for connection failures and a circuit breaker so a
+dead Zinc fails fast instead of tying up request threads.
+"""
+import json
+import threading
+import time
+from typing import Iterable, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+WRITE_TARGET_TTL = 30  # seconds a worker keeps using the alias target it resolved
+
+
+class ZincError(Exception):
+    """Any failure talking to ZincSearch."""
+
+    def __init__(self, message: str = "", status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code  # HTTP status, or None if no response came back
+
+
+class ZincUnavailable(ZincError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # Half-open: once the cooldown has passed, admit exactly one probe and
+            # re-arm the timer, so everyone else keeps failing fast until it reports
+            # back (or until another cooldown passes if it never does)
+            now = time.monotonic()
+            if now - self._opened_at >= self.cooldown:
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ZincClient:
+    def __init__(
+        self,
+        *,
+        host: str,
+        user: str,
+        password: str,
+        index: str,
+        timeout: tuple,
+        pool_size: int,
+        max_retries: int,
+        breaker: CircuitBreaker,
+    ):
+        self.host = host.rstrip("/")
+        self.index_name = index
+        self.timeout = timeout
+        self.breaker = breaker
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            status=max_retries,
+            # Never re-send after a read timeout: a hung Zinc would hold the caller for
+            # (retries + 1) x read timeout and still only count as one breaker failure
+            read=0,
+            other=0,
+            backoff_factor=0.1,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,  # Zinc writes are idempotent by _id
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._write_targets: Optional[List[str]] = None
+        self._write_targets_at = 0.0
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise ZincUnavailable("ZincSearch circuit is open")
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, f"{self.host}{path}", **kwargs)
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as exc:
+            # 4xx is our fault, not Zinc's; only 5xx counts against the breaker
+            status_code = exc.response.status_code if exc.response is not None else None
+            if status_code is None or status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise ZincError(str(exc), status_code) from exc
+        except requests.exceptions.RequestException as exc:
+            self.breaker.record_failure()
+            raise ZincError(str(exc)) from exc
+        self.breaker.record_success()
+        return response
+
+    # ---------- Documents ----------
+    def write_indexes(self) -> List[str]:
+        """
+        Concrete indexes that writes to `index_name` should go to. Searches go
+        through the alias, but writes name its target(s) explicitly rather than
+        relying on Zinc to resolve an alias for _doc/_bulk (it may create a
+        concrete index of that name instead). Cached for WRITE_TARGET_TTL seconds.
+        """
+        now = time.monotonic()
+        if self._write_targets is None or now - self._write_targets_at >= WRITE_TARGET_TTL:
+            try:
+                targets = list(self._request("GET", f"/es/{self.index_name}/_alias").json())
+            except ZincError as exc:
+                if exc.status_code is None or exc.status_code >= 500:
+                    raise  # don't guess while Zinc is unreachable
+                targets = []  # not an alias (yet): index_name is the concrete index
+            self._write_targets = targets or [self.index_name]
+            self._write_targets_at = now
+        return self._write_targets
+
+    def index(self, doc_id, document: dict, *, index: Optional[str] = None) -> None:
+        for name in [index] if index else self.write_indexes():
+            self._request("PUT", f"/api/{name}/_doc/{doc_id}", json=document)
+
+    def delete(self, doc_id, *, index: Optional[str] = None) -> None:
+        for name in [index] if index else self.write_indexes():
+            self._request("DELETE", f"/api/{name}/_doc/{doc_id}")
+
+    def bulk(self, actions: Iterable[dict], *, timeout=None) -> dict:
+        """Sends `_bulk` actions (action/document lines, already paired) as NDJSON."""
+        payload = "\n".join(json.dumps(line) for line in actions) + "\n"
+        return self._request("POST", "/api/_bulk", data=payload, timeout=timeout or self.timeout).json()
+
+    def search(self, query: dict, *, index: Optional[str] = None) -> dict:
+        return self._request("POST", f"/api/{index or self.index_name}/_search", json=query).json()
+
+    # ---------- Indexes ----------
+    def create_index(self, name: str, storage_type: str = "disk") -> None:
+        self._request("PUT", "/api/index", json={"name": name, "storage_type": storage_type})
+
+    def delete_index(self, name: str) -> None:
+        self._request("DELETE", f"/api/index/{name}")
+
+    def index_exists(self, name: str) -> bool:
+        try:
+            self._request("GET", f"/api/index/{name}")
+        except ZincError:
+            return False
+        return True
+
+    def doc_count(self, name: str) -> int:
+        index = self._request("GET", f"/api/index/{name}").json()
+        return index.get("stats", {}).get("doc_num", 0)
+
+    # ---------- Aliases (ES-compatible API) ----------
+    def alias_targets(self, alias: str) -> list:
+        """Names of the concrete indexes behind `alias`; empty if it isn't an alias."""
+        try:
+            return list(self._request("GET", f"/es/{alias}/_alias").json())
+        except ZincError:
+            return []
+
+    def update_aliases(self, actions: list) -> None:
+        """Applies add/remove alias actions in one request, so a swap is atomic."""
+        self._request("POST", "/es/_aliases", json={"actions": actions})
+
+
+_client: Optional[ZincClient] = None
+_client_lock = threading.Lock()
+
+
+def get_zinc() -> ZincClient:
+    """Returns this process's client, built lazily so forked workers get their own pool."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ZincClient(
+                    host=settings.ZINC_HOST,
+                    user=settings.ZINC_USER,
+                    password=settings.ZINC_PASSWORD,
+                    index=settings.ZINC_INDEX,
+                    timeout=(settings.ZINC_CONNECT_TIMEOUT, settings.ZINC_READ_TIMEOUT),
+                    pool_size=settings.ZINC_POOL_SIZE,
+                    max_retries=settings.ZINC_MAX_RETRIES,
+                    breaker=CircuitBreaker(
+                        settings.ZINC_BREAKER_THRESHOLD, settings.ZINC_BREAKER_COOLDOWN
+                    ),
+                )
+    return _client
@@ -0,0 +1,83 @@
+# socialmedia/redis_helpers.py
+"""
+Shared Redis plumbing for the apps' per-purpose Redis databases.
+
+RedisConnection is the one lazily created client per purpose and process
+(BLACKLIST_REDIS_URL, SEARCH_INDEX_REDIS_URL, ...). DebouncedDrain is the
+scheduling half of the write-behind queues: producers push onto a Redis
+structure and only the first one in a window schedules the Celery task that
+drains it.
+"""
+import threading
+from typing import Optional, Sequence
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+
+class RedisConnection:
+    """
+    Callable returning the process-wide client for settings.<url_setting>,
+    connected on first use. reset() drops it, e.g. after overriding the URL in a test.
+    """
+
+    def __init__(self, url_setting: str, *, asyncio: bool = False):
+        self.url_setting = url_setting
+        self._client_class = aioredis.Redis if asyncio else redis.Redis
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_class.from_url(
+                        getattr(settings, self.url_setting), decode_responses=True
+                    )
+                client = self._client
+        return client
+
+    def reset(self) -> None:
+        with self._lock:
+            self._client = None
+
+    def register_script(self, source: str) -> "LazyScript":
+        return LazyScript(self, source)
+
+
+class LazyScript:
+    """A Lua script for a RedisConnection; runs on its current client unless given one (e.g. a pipeline)."""
+
+    def __init__(self, connection: RedisConnection, source: str):
+        self._connection = connection
+        self._source = source
+        self._script = None
+
+    def __call__(self, keys: Sequence = (), args: Sequence = (), client=None):
+        if self._script is None:
+            self._script = self._connection().register_script(self._source)
+        return self._script(keys=keys, args=args, client=client or self._connection())
+
+
+class DebouncedDrain:
+    """
+    One drain task per window for a Redis-backed queue. schedule() runs after
+    each push; only the first in a window queues the task, later ones ride
+    along. The task calls clear() before it takes anything, so items arriving
+    from then on schedule their own drain.
+    """
+
+    def __init__(self, connection: RedisConnection, flag_key: str, interval: int):
+        self.connection = connection
+        self.flag_key = flag_key
+        self.interval = interval
+
+    def schedule(self, task, client: Optional[redis.Redis] = None) -> None:
+        client = client or self.connection()
+        # The flag's TTL only matters if a scheduled drain never runs
+        if client.set(self.flag_key, 1, nx=True, ex=self.interval * 30):
+            task.apply_async(countdown=self.interval)
+
+    def clear(self) -> None:
+        self.connection().delete(self.flag_key)
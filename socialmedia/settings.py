@@ -146,8 +146,28 @@ CHANNEL_LAYERS = {
     },
 }
 BLACKLIST_REDIS_URL = f'redis://{_redis_host}:{_redis_port}/{os.getenv("REDIS_DB_BLACKLIST", 2)}'
+SEARCH_INDEX_REDIS_URL = f'redis://{_redis_host}:{_redis_port}/{os.getenv("REDIS_DB_SEARCH_INDEX", 3)}'
+CHAT_REDIS_URL      = f'redis://{_redis_host}:{_redis_port}/{os.getenv("REDIS_DB_CHAT", 4)}'
+MAIL_QUEUE_REDIS_URL = f'redis://{_redis_host}:{_redis_port}/{os.getenv("REDIS_DB_MAIL", 5)}'
+OTP_REDIS_URL       = f'redis://{_redis_host}:{_redis_port}/{os.getenv("REDIS_DB_OTP", 6)}'
+# 'apps.users.otp.DatabaseOTPStore' keeps codes in the UserOTP table instead
+OTP_STORE           = os.getenv('OTP_STORE', 'apps.users.otp.RedisOTPStore')
 CELERY_BROKER_URL   = f'redis://{_redis_host}:{_redis_port}/{os.getenv("REDIS_DB_CHANNELS", 0)}'
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
+CELERY_BEAT_SCHEDULE = {
+    'sweep-avatar-files': {
+        'task': 'apps.users.tasks.sweep_avatar_files_task',
+        'schedule': 6 * 60 * 60,  # seconds
+    },
+    'compact-refresh-tokens': {
+        'task': 'apps.users.tasks.compact_refresh_tokens_task',
+        'schedule': 24 * 60 * 60,
+    },
+    'purge-expired-otps': {
+        'task': 'apps.users.tasks.purge_expired_otps_task',
+        'schedule': 60 * 60,
+    },
+}
 
 # --------------------------------------------------
 # 9.  Password validators (unchanged)
@@ -174,6 +194,7 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL  = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+PRIVATE_MEDIA_ROOT = BASE_DIR / 'private_media'  # never routed; raw avatar uploads live here
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # --------------------------------------------------
@@ -197,7 +218,9 @@ GRAPHQL_JWT = {
     'JWT_EXPIRATION_DELTA': JWT_EXPIRATION_DELTA,
     'JWT_REFRESH_EXPIRATION_DELTA': JWT_REFRESH_EXPIRATION_DELTA,
     'JWT_ERROR_HANDLER': 'apps.graphql_api.utils.jwt_error_handler',
+    'JWT_PAYLOAD_HANDLER': 'apps.users.auth.jwt_payload',
 }
+JWT_PAYLOAD_CACHE_SIZE = int(os.getenv('JWT_PAYLOAD_CACHE_SIZE', 10000))  # verified payloads kept per process
 AUTHENTICATION_BACKENDS = [
     'graphql_jwt.backends.JSONWebTokenBackend',
     'django.contrib.auth.backends.ModelBackend',
@@ -208,9 +231,29 @@ AUTHENTICATION_BACKENDS = [
 # --------------------------------------------------
 TURNSTILE_SITE_KEY   = os.getenv('TURNSTILE_SITE_KEY')
 TURNSTILE_SECRET_KEY = os.getenv('TURNSTILE_SECRET_KEY')
+# 'apps.users.turnstile.StubVerifier' skips Cloudflare entirely (offline load tests only)
+TURNSTILE_VERIFIER   = os.getenv('TURNSTILE_VERIFIER', 'apps.users.turnstile.TurnstileVerifier')
+TURNSTILE_CONNECT_TIMEOUT = float(os.getenv('TURNSTILE_CONNECT_TIMEOUT', 1))
+TURNSTILE_READ_TIMEOUT    = float(os.getenv('TURNSTILE_READ_TIMEOUT', 3))
+TURNSTILE_POOL_SIZE       = int(os.getenv('TURNSTILE_POOL_SIZE', 10))
+TURNSTILE_CACHE_TIMEOUT   = 300  # seconds; a token is only valid for 5 minutes anyway
+
+# --------------------------------------------------
+# 15.  ZincSearch
+# --------------------------------------------------
+ZINC_HOST              = os.getenv('ZINC_HOST', 'http://localhost:4080')
+ZINC_USER              = os.getenv('ZINC_USER', 'admin')
+ZINC_PASSWORD          = os.getenv('ZINC_PASSWORD', 'Admin@123')
+ZINC_INDEX             = os.getenv('ZINC_INDEX', 'profiles')
+ZINC_CONNECT_TIMEOUT   = float(os.getenv('ZINC_CONNECT_TIMEOUT', 0.5))
+ZINC_READ_TIMEOUT      = float(os.getenv('ZINC_READ_TIMEOUT', 2))
+ZINC_POOL_SIZE         = int(os.getenv('ZINC_POOL_SIZE', 10))      # keep-alive connections per worker process
+ZINC_MAX_RETRIES       = int(os.getenv('ZINC_MAX_RETRIES', 2))     # connection errors / 502-504 only
+ZINC_BREAKER_THRESHOLD = int(os.getenv('ZINC_BREAKER_THRESHOLD', 5))
+ZINC_BREAKER_COOLDOWN  = float(os.getenv('ZINC_BREAKER_COOLDOWN', 30))
 
 # --------------------------------------------------
-# 15.  Email (Gmail SMTP)
+# 16.  Email (Gmail SMTP)
 # --------------------------------------------------
 EMAIL_BACKEND       = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST          = 'smtp.gmail.com'
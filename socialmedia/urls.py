@@ -15,9 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf.urls.static import static
 from django.conf import settings
+from apps.users.views import serve_avatar
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -25,4 +26,9 @@ urlpatterns = [
     path('api/users/', include('apps.users.urls')),  # REST endpoint
 ]
 
+if settings.DEBUG:
+    # Renditions only (no subdirectories); must come before the generic media route
+    urlpatterns.append(
+        re_path(r'^%s(?P<path>avatars/[^/]+\.jpg)$' % settings.MEDIA_URL.lstrip('/'), serve_avatar)
+    )
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)